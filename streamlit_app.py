@@ -3,7 +3,9 @@
 # RUN:
 #   pip install streamlit streamlit-elements streamlit-calendar pillow
 #   # Optional MIME:  python-magic-bin (Windows)  |  python-magic (Linux/Mac)
-#   # Optional video thumbnails: pip install moviepy
+#   # Optional video thumbnails: opencv-python-headless, an ffmpeg binary on PATH, or pip install moviepy
+#   # Optional faster thumbnail resize: pip install opencv-python-headless
+#   # Optional faster upload hashing: pip install blake3
 #   streamlit run streamlit_app.py
 #
 # Highlights:
@@ -20,8 +22,19 @@
 
 from __future__ import annotations
 
-import os, uuid, io, calendar
+import os, uuid, io, calendar, random
+import atexit
+import time as _time
+import json
+import queue
+import re
+import shutil
 import sqlite3
+import subprocess
+import threading
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Iterable, Optional, List, Dict, Tuple
 from datetime import datetime, date, time, timedelta, timezone
@@ -52,7 +65,8 @@ except Exception:
     CAL_OK = False
 
 # ---------- Imaging / MIME ----------
-from PIL import Image
+from PIL import Image, ImageOps, features as _pil_features
+WEBP_OK = bool(_pil_features.check("webp"))
 try:
     import magic  # python-magic or python-magic-bin
     MAGIC_OK = True
@@ -65,8 +79,39 @@ try:
     MOVIEPY_OK = True
 except Exception:
     MOVIEPY_OK = False
+
+# ffmpeg CLI on PATH: first-frame grabs without importing moviepy
+FFMPEG_BIN = shutil.which("ffmpeg")
+
+# ---------- Optional fast content hashing ----------
+try:
+    import blake3
+    BLAKE3_OK = True
+except Exception:
+    BLAKE3_OK = False
+
+# ---------- Optional SIMD resize ----------
+try:
+    import cv2
+    import numpy as np
+    CV2_OK = True
+except Exception:
+    CV2_OK = False
+
+# ---------- st.rerun()/st.stop() control flow (internal; moved between releases) ----------
+try:
+    from streamlit.runtime.scriptrunner_utils.exceptions import RerunException, StopException
+except Exception:
+    try:
+        from streamlit.runtime.scriptrunner import RerunException, StopException
+    except Exception:
+        RerunException = StopException = None
+SCRIPT_CONTROL_EXC = tuple(e for e in (RerunException, StopException) if e is not None)
 # === ADD-ON BLOCK A: Utilities & Add-on schema (profiles, rsvp, settings, reset, sticky, theme) ===
-def _init_addon_schema():
+# Schema setup runs once per server process, not on every rerun; clear the
+# cache (or restart) to re-run it.
+@st.cache_resource(show_spinner=False)
+def _init_addon_schema() -> bool:
     c = get_conn(); cur = c.cursor()
     # Profiles (per Family + unique username)
     cur.execute("""
@@ -114,6 +159,7 @@ def _init_addon_schema():
         );
     """)
     c.commit()
+    return True
 
 
 def _get_setting(family:str, key:str, default:str|None=None) -> str|None:
@@ -138,10 +184,10 @@ def _get_or_create_profile(family:str, username:str, first:str|None=None, last:s
 
 def _save_avatar(upload) -> str|None:
     try:
-        path, thumb, mime, mtype = save_media(upload)
+        path, mime, mtype = save_media(upload)
         if mtype != "image":
             return None
-        return thumb or path
+        return path
     except Exception:
         return None
 import hashlib
@@ -202,26 +248,58 @@ def _stick_user_to_url_and_settings(username:str, family:str):
     # Remember as last active for this family
     _set_setting(family, "last_active_user", username)
 
+THEME_CSS = Path(__file__).with_name("static") / "theme.css"
+
+@st.cache_resource(show_spinner=False)
+def _theme_href() -> str:
+    # mtime as a cache-buster, so an edited stylesheet isn't served stale from the browser cache
+    try:
+        return f"/app/static/theme.css?v={int(THEME_CSS.stat().st_mtime)}"
+    except OSError:
+        return "/app/static/theme.css"
+
 def _theme_css():
-    st.markdown("""
-    <style>
-      /* Make text readable in both light/dark themes via inherited colors */
-      .stApp, .stApp * { color-scheme: light dark; }
-      .stApp [data-testid="stMarkdown"] p, 
-      .stApp [data-testid="stSidebar"] * { 
-        color: inherit !important;
-      }
-      /* Inputs and captions readable in dark */
-      .stApp .stCaption,
-      .stApp [data-baseweb="base-input"] input,
-      .stApp [data-testid="stSelectbox"] div {
-        color: inherit !important;
-      }
-      /* RSVP chips */
-      .chip { display:inline-flex; align-items:center; gap:6px; padding:4px 8px; border-radius:999px; border:1px solid var(--chip-b, #ccc); margin:2px; font-size:12px;}
-      .chip img { width:20px; height:20px; border-radius:50%; object-fit:cover; }
-    </style>
-    """, unsafe_allow_html=True)
+    # Elements don't survive a rerun, so this is still sent each time, but as one
+    # short <link> instead of ~4 KB of inline <style>; the browser caches the file
+    st.markdown(f'<link rel="stylesheet" href="{_theme_href()}">', unsafe_allow_html=True)
+
+# Children before parents, so the wipe also works with foreign_keys=ON
+RESET_TABLES = (
+    "reactions", "comments", "list_items", "lists", "documents", "notes",
+    "post_comments", "post_likes", "post_media", "posts", "albums",
+    "chat_messages", "chat_rooms", "event_rsvps", "events", "user_profiles", "app_settings",
+)
+
+def _wipe_all_tables(include_users: bool = False) -> None:
+    """All the reset DELETEs in one transaction: a single WAL commit/fsync instead
+    of one per table, and no half-wiped DB if one of them fails."""
+    tables = RESET_TABLES + (("users",) if include_users else ())
+    with _write_lock():
+        conn = get_conn()
+        try:
+            # one call into sqlite3 for the whole batch
+            conn.executescript(
+                "BEGIN IMMEDIATE;\n" + "".join(f"DELETE FROM {t};\n" for t in tables) + "COMMIT;"
+            )
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+def _purge_uploads() -> None:
+    # unlink is a blocking syscall per file; overlap them (slow disks / network FS).
+    # scandir yields plain path strings: no Path object per entry
+    def _rm(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    try:
+        with os.scandir(UPLOAD_DIR) as it, \
+             ThreadPoolExecutor(max_workers=16, thread_name_prefix="hive-purge") as pool:
+            list(pool.map(_rm, (e.path for e in it if not e.is_dir(follow_symlinks=False))))
+    except Exception:
+        pass
 
 def _factory_reset_ui():
     with st.sidebar.expander("🧨 Admin · Factory Reset", expanded=False):
@@ -231,28 +309,9 @@ def _factory_reset_ui():
             if txt.strip() == "RESET":
                 try:
                     # Clear DB tables instead of deleting file to keep schema
-                    exec1("DELETE FROM reactions", ())
-                    exec1("DELETE FROM comments", ())
-                    exec1("DELETE FROM list_items", ())
-                    exec1("DELETE FROM lists", ())
-                    exec1("DELETE FROM documents", ())
-                    exec1("DELETE FROM notes", ())
-                    exec1("DELETE FROM post_comments", ())
-                    exec1("DELETE FROM post_likes", ())
-                    exec1("DELETE FROM post_media", ())
-                    exec1("DELETE FROM posts", ())
-                    exec1("DELETE FROM albums", ())
-                    exec1("DELETE FROM chat_messages", ())
-                    exec1("DELETE FROM event_rsvps", ())
-                    exec1("DELETE FROM events", ())
-                    exec1("DELETE FROM user_profiles", ())
-                    exec1("DELETE FROM app_settings", ())
+                    _wipe_all_tables()
                     # Nuke uploads
-                    try:
-                        for p in UPLOAD_DIR.glob("*"):
-                            p.unlink(missing_ok=True)
-                    except Exception:
-                        pass
+                    _purge_uploads()
                     # Vacuum
                     exec1("VACUUM", ())
                     st.success("Factory reset complete.")
@@ -273,160 +332,362 @@ COLOR_PRESETS = {"Yellow":"#FFF176","Red":"#EE0E2C","Green":"#81C784","Blue":"#6
 EMOJI_CHOICES = ["👍","❤️","😂","🤔","✅"]
 
 MAX_MB = 200
-IMG_MIMES = {"image/jpeg","image/png","image/gif"}
+IMG_MIMES = {"image/jpeg","image/png","image/gif","image/webp"}
 VID_MIMES = {"video/mp4","video/webm","video/quicktime"}  # .mov
 ALLOWED_MIMES = IMG_MIMES | VID_MIMES
 THUMB_MAX = (1200, 1200)
 
 PAGE_SIZE = 25
 
+READ_POOL_SIZE = 4
+
 # ==================== DB ====================
-@st.cache_resource(show_spinner=False)
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+def _open_conn(read_only: bool = False) -> sqlite3.Connection:
+    # Default statement cache is 128 per connection; the app has more distinct SQL
+    # strings than that (plus IN (?,?,...) variants), so hot ones were being re-prepared
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=512)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA foreign_keys=ON;")
-    conn.execute("PRAGMA busy_timeout=3000;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA mmap_size=268435456;")   # 256 MB; mapped pages are shared by all connections
+    if read_only:
+        conn.execute("PRAGMA busy_timeout=3000;")
+        conn.execute("PRAGMA query_only=ON;")
+        conn.execute("PRAGMA cache_size=-16384;")   # 16 MB each: the pool is READ_POOL_SIZE of these
+    else:
+        conn.execute("PRAGMA busy_timeout=10000;")
+        conn.execute("PRAGMA cache_size=-65536;")   # 64 MB
+        conn.execute("PRAGMA wal_autocheckpoint=1000;")
     return conn
 
+# Single writer connection (exec1, DDL, migrations)
+@st.cache_resource(show_spinner=False)
+def get_conn() -> sqlite3.Connection:
+    return _open_conn()
+
+# Read-only connections for q(): under WAL, SELECTs don't wait on the writer
+# and concurrent sessions don't queue behind each other on one connection
+@st.cache_resource(show_spinner=False)
+def _read_pool() -> queue.LifoQueue:
+    pool = queue.LifoQueue()
+    for _ in range(READ_POOL_SIZE):
+        pool.put(_open_conn(read_only=True))
+    return pool
+
 def q(sql: str, args: Iterable = ()):
-    return get_conn().execute(sql, args).fetchall()
+    pool = _read_pool()
+    conn = pool.get()
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        pool.put(conn)
 
-def exec1(sql: str, args: Iterable = ()):
-    get_conn().execute(sql, args)
+def retry_locked(fn, attempts: int = 5):
+    """Retry fn() on "database is locked" (busy_timeout exhausted), jittered backoff."""
+    for i in range(attempts):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or i == attempts - 1:
+                raise
+            _time.sleep(0.02 * (2 ** i) + random.random() * 0.02)
+
+def q_tuples(sql: str, args: Iterable = ()) -> list:
+    """q() returning plain tuples (no sqlite3.Row per row) for hot positional reads."""
+    pool = _read_pool()
+    conn = pool.get()
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None   # cursor-local; the pooled connection keeps Row
+        return cur.execute(sql, args).fetchall()
+    finally:
+        pool.put(conn)
+
+# Every session thread shares the one writer connection, so an open transaction
+# on it must not pick up another thread's writes. Re-entrant: exec1() inside tx().
+@st.cache_resource(show_spinner=False)
+def _write_lock() -> threading.RLock:
+    return threading.RLock()
+
+@contextmanager
+def tx():
+    """Group several writes into one commit: BEGIN IMMEDIATE ... COMMIT, ROLLBACK on error.
+    st.rerun()/st.stop() inside the block commits first. Nested use joins the outer
+    transaction."""
+    with _write_lock():
+        conn = get_conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        # IMMEDIATE takes the write lock up front, where busy_timeout applies
+        retry_locked(lambda: conn.execute("BEGIN IMMEDIATE"))
+        try:
+            try:
+                yield conn
+            except SCRIPT_CONTROL_EXC:
+                # st.rerun()/st.stop() inside the block is control flow, not a failure:
+                # keep the writes made so far, then let Streamlit unwind
+                conn.execute("COMMIT")
+                raise
+            # inside the try: a failed COMMIT leaves the transaction open, and the
+            # next tx() on this shared connection would silently join it
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+def exec1(sql: str, args: Iterable = ()) -> sqlite3.Cursor:
+    """Run one write; the cursor carries .lastrowid / .rowcount for the caller."""
+    with _write_lock():
+        return retry_locked(lambda: get_conn().execute(sql, args))
+
+def exec_many(sql: str, rows: Iterable) -> None:
+    """executemany inside one transaction: one commit for the whole batch, not one per row."""
+    with tx() as conn:
+        conn.executemany(sql, rows)
+
+# ---- maintenance: weekly VACUUM, periodic WAL truncate, PRAGMA optimize at exit ----
+VACUUM_EVERY_S = 7 * 86400
+VACUUM_STAMP = Path(str(DB_PATH) + ".last_vacuum")
+CHECKPOINT_EVERY_S = 300
+
+def _maybe_vacuum(conn: sqlite3.Connection, lock: threading.RLock) -> None:
+    # In-place VACUUM rather than VACUUM INTO + os.replace: swapping the file under
+    # WAL would strand every pooled connection still holding the old inode (and its -wal)
+    try:
+        if _time.time() - VACUUM_STAMP.stat().st_mtime < VACUUM_EVERY_S:
+            return
+    except OSError:
+        pass   # never vacuumed: do it now
+    try:
+        with lock:
+            conn.execute("VACUUM")   # autocommit writer, so never inside a transaction
+        VACUUM_STAMP.touch()
+    except (sqlite3.Error, OSError):
+        pass
+
+def _locked_pragma(conn: sqlite3.Connection, lock: threading.RLock, sql: str) -> None:
+    # Bounded wait: at interpreter exit a daemon thread may still hold the lock
+    if not lock.acquire(timeout=5):
+        return
+    try:
+        conn.execute(sql)
+    except sqlite3.Error:
+        pass
+    finally:
+        lock.release()
+
+@st.cache_resource(show_spinner=False)
+def start_db_maintenance() -> bool:
+    """Once per process. The writer and its lock are resolved here, on the script
+    thread, so the checkpoint thread and the exit hook never go through st.cache_*."""
+    conn, lock = get_conn(), _write_lock()
+    _maybe_vacuum(conn, lock)
+
+    def _checkpoint_loop():
+        # Readers that never let go can starve the auto-checkpoint; truncate the WAL periodically
+        while True:
+            _time.sleep(CHECKPOINT_EVERY_S)
+            _locked_pragma(conn, lock, "PRAGMA wal_checkpoint(TRUNCATE)")
+
+    threading.Thread(target=_checkpoint_loop, name="hive-wal-checkpoint", daemon=True).start()
+    # Cheap: only re-analyzes tables whose stats the planner found stale
+    atexit.register(_locked_pragma, conn, lock, "PRAGMA optimize")
+    return True
+
+# One PRAGMA table_info per table per process (not per add_col per rerun)
+@st.cache_resource(show_spinner=False)
+def _table_cols(table:str)->frozenset:
+    return frozenset(r["name"] for r in get_conn().execute(f"PRAGMA table_info({table});"))
 
 def has_col(table:str, col:str)->bool:
-    return any(r["name"]==col for r in get_conn().execute(f"PRAGMA table_info({table});").fetchall())
+    return col in _table_cols(table)
 
 def add_col(table:str,col:str,typ:str,default:Optional[str]):
     if not has_col(table,col):
         ddl=f"ALTER TABLE {table} ADD COLUMN {col} {typ}"
         if default is not None: ddl+=f" DEFAULT {default}"
         get_conn().execute(ddl)
+        _table_cols.clear(table)
+
+# Static DDL, applied with one executescript() per block (one parse pass, one
+# transaction) instead of a cur.execute() per statement
+SCHEMA_TABLES_SQL = """
+BEGIN;
+-- Core tables
+CREATE TABLE IF NOT EXISTS notes(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content TEXT NOT NULL,
+    color   TEXT NOT NULL,
+    x REAL DEFAULT 40,
+    y REAL DEFAULT 40,
+    z INTEGER DEFAULT 0,
+    type TEXT DEFAULT 'text',
+    assignee TEXT,
+    due_at TEXT,
+    tags TEXT,
+    order_index INTEGER DEFAULT 0,
+    linked_event_id INTEGER,
+    family TEXT NOT NULL DEFAULT 'public'
+);
+
+CREATE TABLE IF NOT EXISTS lists(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    family TEXT NOT NULL DEFAULT 'public'
+);
+
+CREATE TABLE IF NOT EXISTS list_items(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    list_id INTEGER NOT NULL,
+    text    TEXT NOT NULL,
+    done    INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY(list_id) REFERENCES lists(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS documents(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title   TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    family TEXT NOT NULL DEFAULT 'public'
+);
+
+CREATE TABLE IF NOT EXISTS comments(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    note_id INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    text   TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS reactions(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    note_id INTEGER NOT NULL,
+    emoji TEXT NOT NULL,
+    author TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS events(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    start_at TEXT NOT NULL,
+    end_at   TEXT,
+    assignees TEXT,
+    family TEXT NOT NULL
+);
+
+-- Family Feed
+CREATE TABLE IF NOT EXISTS albums(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    family TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS posts(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    family TEXT NOT NULL,
+    album_id INTEGER,
+    author TEXT NOT NULL,
+    caption TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(album_id) REFERENCES albums(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS post_media(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    thumb_path TEXT,
+    mime TEXT,
+    media_type TEXT NOT NULL DEFAULT 'image',
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS post_likes(
+    post_id INTEGER NOT NULL,
+    author  TEXT NOT NULL,
+    PRIMARY KEY(post_id, author),
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS post_comments(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    text   TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
+);
+
+-- ---- NEW: Group Chat table ----
+CREATE TABLE IF NOT EXISTS chat_messages(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    family TEXT NOT NULL,
+    room TEXT NOT NULL DEFAULT 'general',
+    author TEXT NOT NULL,
+    text   TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+COMMIT;
+"""
+
+# After the add_col migrations: some indexes cover migrated columns (deleted_at)
+SCHEMA_INDEXES_SQL = """
+BEGIN;
+-- Indices
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_rx ON reactions(note_id, emoji, author);
+CREATE INDEX IF NOT EXISTS idx_notes_family ON notes(family);
+CREATE INDEX IF NOT EXISTS idx_notes_order ON notes(order_index DESC, id DESC);
+-- Children are listed newest first per parent; with id DESC in the index that
+-- order comes straight off it (a bare (note_id) still sorts by id in a temp b-tree)
+DROP INDEX IF EXISTS idx_comments_note;
+CREATE INDEX IF NOT EXISTS idx_comments_note_id ON comments(note_id, id DESC);
+-- uniq_rx already leads with note_id (and covers the per-note emoji GROUP BY)
+DROP INDEX IF EXISTS idx_reactions_note;
+CREATE INDEX IF NOT EXISTS idx_events_family_start ON events(family, start_at);
+CREATE INDEX IF NOT EXISTS idx_lists_family ON lists(family);
+CREATE INDEX IF NOT EXISTS idx_docs_family ON documents(family);
+CREATE INDEX IF NOT EXISTS idx_posts_family ON posts(family);
+-- (family) alone also serves "ORDER BY id DESC": the rowid is the index's implicit last column
+CREATE INDEX IF NOT EXISTS idx_albums_family ON albums(family);
+-- Partial indexes: only active rows are indexed, so soft-deleted history costs the
+-- listing queries nothing (they must keep the literal "deleted_at IS NULL" term)
+CREATE INDEX IF NOT EXISTS idx_notes_active ON notes(family, order_index DESC, id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_notes_due ON notes(family, due_at) WHERE deleted_at IS NULL AND due_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_lists_active ON lists(family, id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_docs_active ON documents(family, id DESC) WHERE deleted_at IS NULL;
+-- NEW: chat indexes. Chat pages are keyset on id (latest-N, "older than id"), so the
+-- id has to be the third column; (family, room, created_at) still left a sort
+DROP INDEX IF EXISTS idx_chat_family_room_time;
+CREATE INDEX IF NOT EXISTS idx_chat_family_room_id ON chat_messages(family, room, id);
+-- FK children looked up per post (media grid, comment list/count); SQLite doesn't
+-- index FK columns on its own
+CREATE INDEX IF NOT EXISTS idx_post_media_post ON post_media(post_id);
+DROP INDEX IF EXISTS idx_post_comments_post;
+CREATE INDEX IF NOT EXISTS idx_post_comments_post_id ON post_comments(post_id, id DESC);
+CREATE INDEX IF NOT EXISTS idx_list_items_list_id ON list_items(list_id, id DESC);
+-- wishlist image reuse looks items up by product link; most items have none
+CREATE INDEX IF NOT EXISTS idx_list_items_url ON list_items(url) WHERE url IS NOT NULL;
+
+-- Backfill legacy NULLs
+UPDATE list_items SET done=0 WHERE done IS NULL;
+UPDATE documents SET content='' WHERE content IS NULL;
+UPDATE events SET all_day=0 WHERE all_day IS NULL;
+COMMIT;
+"""
 
-def init_schema():
+@st.cache_resource(show_spinner=False)
+def init_schema() -> bool:
     c = get_conn(); cur = c.cursor()
 
-    # Core tables
-    cur.execute("""CREATE TABLE IF NOT EXISTS notes(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        content TEXT NOT NULL,
-        color   TEXT NOT NULL,
-        x REAL DEFAULT 40,
-        y REAL DEFAULT 40,
-        z INTEGER DEFAULT 0,
-        type TEXT DEFAULT 'text',
-        assignee TEXT,
-        due_at TEXT,
-        tags TEXT,
-        order_index INTEGER DEFAULT 0,
-        linked_event_id INTEGER,
-        family TEXT NOT NULL DEFAULT 'public'
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS lists(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        family TEXT NOT NULL DEFAULT 'public'
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS list_items(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        list_id INTEGER NOT NULL,
-        text    TEXT NOT NULL,
-        done    INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY(list_id) REFERENCES lists(id) ON DELETE CASCADE
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS documents(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title   TEXT NOT NULL,
-        content TEXT NOT NULL DEFAULT '',
-        family TEXT NOT NULL DEFAULT 'public'
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS comments(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        note_id INTEGER NOT NULL,
-        author TEXT NOT NULL,
-        text   TEXT NOT NULL,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE CASCADE
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS reactions(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        note_id INTEGER NOT NULL,
-        emoji TEXT NOT NULL,
-        author TEXT,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE CASCADE
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS events(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        start_at TEXT NOT NULL,
-        end_at   TEXT,
-        assignees TEXT,
-        family TEXT NOT NULL
-    );""")
-
-    # Family Feed
-    cur.execute("""CREATE TABLE IF NOT EXISTS albums(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        family TEXT NOT NULL,
-        created_at TEXT NOT NULL DEFAULT (datetime('now'))
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS posts(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        family TEXT NOT NULL,
-        album_id INTEGER,
-        author TEXT NOT NULL,
-        caption TEXT,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY(album_id) REFERENCES albums(id) ON DELETE SET NULL
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS post_media(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        post_id INTEGER NOT NULL,
-        path TEXT NOT NULL,
-        thumb_path TEXT,
-        mime TEXT,
-        media_type TEXT NOT NULL DEFAULT 'image',
-        FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS post_likes(
-        post_id INTEGER NOT NULL,
-        author  TEXT NOT NULL,
-        PRIMARY KEY(post_id, author),
-        FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
-    );""")
-
-    cur.execute("""CREATE TABLE IF NOT EXISTS post_comments(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        post_id INTEGER NOT NULL,
-        author TEXT NOT NULL,
-        text   TEXT NOT NULL,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY(post_id) REFERENCES posts(id) ON DELETE CASCADE
-    );""")
-
-    # ---- NEW: Group Chat table ----
-    cur.execute("""CREATE TABLE IF NOT EXISTS chat_messages(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        family TEXT NOT NULL,
-        room TEXT NOT NULL DEFAULT 'general',
-        author TEXT NOT NULL,
-        text   TEXT NOT NULL,
-        created_at TEXT NOT NULL DEFAULT (datetime('now'))
-    );""")
+    c.executescript(SCHEMA_TABLES_SQL)
 
     # ---- migrations (safe no-ops if present) ----
     add_col("notes", "deleted_at", "TEXT", None)
@@ -444,29 +705,324 @@ def init_schema():
     add_col("list_items", "purchased_by", "TEXT", None)
     add_col("list_items", "image_url", "TEXT", None)
 
-    # Indices
-    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uniq_rx ON reactions(note_id, emoji, author);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_notes_family ON notes(family);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_notes_order ON notes(order_index DESC, id DESC);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_note ON comments(note_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_reactions_note ON reactions(note_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_family_start ON events(family, start_at);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_lists_family ON lists(family);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_docs_family ON documents(family);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_family ON posts(family);")
-    # NEW: chat indexes
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_family_room_time ON chat_messages(family, room, created_at);")
-
-    # Backfill legacy NULLs
-    cur.execute("UPDATE list_items SET done=0 WHERE done IS NULL;")
-    cur.execute("UPDATE documents SET content='' WHERE content IS NULL;")
-    cur.execute("UPDATE events SET all_day=0 WHERE all_day IS NULL;")
+    c.executescript(SCHEMA_INDEXES_SQL)
 
+    _init_counters(cur)
+    _init_notes_fts(cur)
+    _init_chat_rooms(cur)
     c.commit()
+    # The planner only weighs the composite/partial indexes properly with stats:
+    # full ANALYZE the first time, then PRAGMA optimize (re-analyzes only what drifted)
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone():
+        c.execute("ANALYZE")
+    else:
+        c.execute("PRAGMA optimize")
+    return True
+
+# ---- precomputed counts (pager "Page x of y" without COUNT(*) scans) ----
+# Keys: "notes_active:<family>", "posts:<family>". Triggers keep them exact.
+COUNTER_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_cnt_ins AFTER INSERT ON notes WHEN NEW.deleted_at IS NULL BEGIN
+         INSERT OR IGNORE INTO counters(name, value) VALUES('notes_active:'||NEW.family, 0);
+         UPDATE counters SET value=value+1 WHERE name='notes_active:'||NEW.family;
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_cnt_del AFTER DELETE ON notes WHEN OLD.deleted_at IS NULL BEGIN
+         UPDATE counters SET value=value-1 WHERE name='notes_active:'||OLD.family;
+       END;""",
+    # soft delete / restore / family move: take it off the old key, put it on the new one
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_cnt_upd AFTER UPDATE OF deleted_at, family ON notes BEGIN
+         UPDATE counters SET value=value-1 WHERE OLD.deleted_at IS NULL AND name='notes_active:'||OLD.family;
+         INSERT OR IGNORE INTO counters(name, value) SELECT 'notes_active:'||NEW.family, 0 WHERE NEW.deleted_at IS NULL;
+         UPDATE counters SET value=value+1 WHERE NEW.deleted_at IS NULL AND name='notes_active:'||NEW.family;
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS trg_posts_cnt_ins AFTER INSERT ON posts BEGIN
+         INSERT OR IGNORE INTO counters(name, value) VALUES('posts:'||NEW.family, 0);
+         UPDATE counters SET value=value+1 WHERE name='posts:'||NEW.family;
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS trg_posts_cnt_del AFTER DELETE ON posts BEGIN
+         UPDATE counters SET value=value-1 WHERE name='posts:'||OLD.family;
+       END;""",
+)
+
+def _init_counters(cur: sqlite3.Cursor) -> None:
+    # cur is on the writer, so this all runs in one tx(): no insert can land between
+    # the triggers and the seed (counted twice), and a crash can't leave the table
+    # created but never seeded
+    with tx():
+        fresh = not cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='counters'").fetchone()
+        cur.execute("CREATE TABLE IF NOT EXISTS counters(name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;")
+        for ddl in COUNTER_TRIGGERS:
+            cur.execute(ddl)
+        if fresh:   # one-time seed from existing rows; triggers maintain it from here on
+            cur.execute("""INSERT INTO counters(name, value)
+                           SELECT 'notes_active:'||family, COUNT(*) FROM notes WHERE deleted_at IS NULL GROUP BY family""")
+            cur.execute("""INSERT INTO counters(name, value)
+                           SELECT 'posts:'||family, COUNT(*) FROM posts GROUP BY family""")
+
+# ---- full-text search over notes (the corkboard's search / assignee / tags filters) ----
+# External-content FTS5: the index stores only tokens and points back at notes.id.
+# Triggers keep it in step; UPDATE OF lists only the indexed columns, so layout
+# drags (x/y writes) never touch it.
+NOTES_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+           content, assignee, tags, content='notes', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2');""",
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_fts_ins AFTER INSERT ON notes BEGIN
+         INSERT INTO notes_fts(rowid, content, assignee, tags) VALUES (NEW.id, NEW.content, NEW.assignee, NEW.tags);
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_fts_del AFTER DELETE ON notes BEGIN
+         INSERT INTO notes_fts(notes_fts, rowid, content, assignee, tags)
+           VALUES ('delete', OLD.id, OLD.content, OLD.assignee, OLD.tags);
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS trg_notes_fts_upd AFTER UPDATE OF content, assignee, tags ON notes BEGIN
+         INSERT INTO notes_fts(notes_fts, rowid, content, assignee, tags)
+           VALUES ('delete', OLD.id, OLD.content, OLD.assignee, OLD.tags);
+         INSERT INTO notes_fts(rowid, content, assignee, tags) VALUES (NEW.id, NEW.content, NEW.assignee, NEW.tags);
+       END;""",
+)
+
+def _init_notes_fts(cur: sqlite3.Cursor) -> None:
+    fresh = not cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='notes_fts'").fetchone()
+    try:
+        for ddl in NOTES_FTS_DDL:
+            cur.execute(ddl)
+    except sqlite3.OperationalError:
+        return   # SQLite built without FTS5: get_notes_page keeps the LIKE scan
+    if fresh:   # index the notes that predate the table
+        cur.execute("INSERT INTO notes_fts(notes_fts) VALUES('rebuild');")
+
+# Room names per family. The room picker used to be a DISTINCT over all of
+# chat_messages, with a synthetic "Room created" message to make a new room show up
+CHAT_ROOMS_DDL = """CREATE TABLE IF NOT EXISTS chat_rooms(
+    family TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    PRIMARY KEY(family, name)
+)"""
+
+def _init_chat_rooms(cur: sqlite3.Cursor) -> None:
+    fresh = not cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='chat_rooms'").fetchone()
+    cur.execute(CHAT_ROOMS_DDL)
+    if fresh:   # one-time backfill from the rooms that already have messages
+        cur.execute("INSERT OR IGNORE INTO chat_rooms(family, name) SELECT DISTINCT family, room FROM chat_messages")
+
+@st.cache_resource(show_spinner=False)
+def notes_fts_ok() -> bool:
+    init_schema()
+    return bool(q_tuples("SELECT 1 FROM sqlite_master WHERE type='table' AND name='notes_fts'"))
+
+def fts_prefix_query(column: str, text: str) -> str:
+    """'pick up' -> 'content:"pick"* AND content:"up"*'. Every word is quoted, so
+    user input can't inject FTS5 operators."""
+    return " AND ".join(f'{column}:"{w.replace(chr(34), chr(34) * 2)}"*' for w in text.split())
+
+_FTS_TOKEN_RE = re.compile(r"[^\W_]")   # what unicode61 keeps: letters and digits
+
+def fts_tokenizable(text: str) -> bool:
+    """False if some word has nothing the tokenizer indexes ('---', '!!'): its phrase
+    comes out empty and MATCH quietly returns no rows, so LIKE has to take the filter."""
+    return all(_FTS_TOKEN_RE.search(w) for w in text.split())
+
+def get_counter(name: str) -> int:
+    rows = q_tuples("SELECT value FROM counters WHERE name=?", (name,))
+    return rows[0][0] if rows else 0
+
+# ==================== CACHED READS ====================
+# PRAGMA data_version on one fixed connection changes whenever any *other*
+# connection (our writer, another server process) commits. Cached reads take it
+# as an argument, so a committed write anywhere simply misses the cache and
+# no write site ever needs to call .clear().
+@st.cache_resource(show_spinner=False)
+def _probe_conn() -> sqlite3.Connection:
+    return _open_conn(read_only=True)
+
+# Every session thread probes the one connection; sqlite3 connections aren't safe
+# to use from several threads at once
+@st.cache_resource(show_spinner=False)
+def _probe_lock() -> threading.Lock:
+    return threading.Lock()
+
+def db_version() -> int:
+    with _probe_lock():
+        return _probe_conn().execute("PRAGMA data_version;").fetchone()[0]
+
+def fetch_if_changed(key: str, probe, loader):
+    """Per-session memo: rerun loader() only when probe differs from last time.
+    Use db_version() as the probe; unlike MAX(id) it also moves on edits and deletes.
+    loader() should return plain values (dicts/tuples), not sqlite3.Row lists: the
+    result lives in session_state across reruns."""
+    pkey, dkey = f"{key}:probe", f"{key}:data"
+    if dkey in st.session_state and st.session_state.get(pkey) == probe:
+        return st.session_state[dkey]
+    data = loader()
+    st.session_state[pkey] = probe
+    st.session_state[dkey] = data
+    return data
+
+# Due filters as literal SQL (not "?='All' OR ..."), so each mode is its own plan
+# and the "due_at IS NOT NULL" term lets SQLite pick the partial idx_notes_due.
+# due_at is stored as UTC ISO text: range tests are plain string comparisons.
+_DUE_SQL = {
+    "Due today": " AND due_at IS NOT NULL AND due_at >= ? AND due_at < ?",
+    "Overdue":   " AND due_at IS NOT NULL AND due_at < ?",
+}
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def get_notes_page(family: str, search: str, assignee: str, tags: str, page: int, version: int,
+                   due: str = "All", due_ref: str = "") -> List[Dict]:
+    """due: "All" | "Due today" (due_ref = UTC date) | "Overdue" (due_ref = UTC now).
+    Filtered before LIMIT/OFFSET, so pages stay full. Text filters go through
+    notes_fts (word-prefix match) when FTS5 is available and every word has something
+    to tokenize, else a LIKE scan (substring match)."""
+    if due == "Due today":
+        due_args = (due_ref, (date.fromisoformat(due_ref) + timedelta(days=1)).isoformat())
+    elif due == "Overdue":
+        due_args = (due_ref,)
+    else:
+        due_args = ()
+    match = " AND ".join(filter(None, (fts_prefix_query("content", search),
+                                       fts_prefix_query("assignee", assignee),
+                                       fts_prefix_query("tags", tags))))
+    if match and notes_fts_ok() and all(map(fts_tokenizable, (search, assignee, tags))):
+        rows = q(
+            # CROSS JOIN pins the order: matches first, then a rowid lookup each
+            # (left to the planner it walks every family note and probes the index)
+            """SELECT n.* FROM notes_fts CROSS JOIN notes n ON n.id = notes_fts.rowid
+               WHERE notes_fts MATCH ? AND n.family=? AND (n.deleted_at IS NULL)"""
+            + _DUE_SQL.get(due, "") +
+            """ ORDER BY n.order_index DESC, n.id DESC
+               LIMIT ? OFFSET ?""",
+            (match, family, *due_args, PAGE_SIZE, page * PAGE_SIZE)
+        )
+        return [dict(r) for r in rows]
+    rows = q(
+        """SELECT * FROM notes
+           WHERE family=? AND (deleted_at IS NULL)
+             AND (?='' OR LOWER(content) LIKE '%'||LOWER(?)||'%')
+             AND (?='' OR LOWER(COALESCE(assignee,'')) LIKE '%'||LOWER(?)||'%')
+             AND (?='' OR LOWER(COALESCE(tags,'')) LIKE '%'||LOWER(?)||'%')"""
+        + _DUE_SQL.get(due, "") +
+        """ ORDER BY order_index DESC, id DESC
+           LIMIT ? OFFSET ?""",
+        (family, search, search, assignee, assignee, tags, tags, *due_args,
+         PAGE_SIZE, page * PAGE_SIZE)
+    )
+    return [dict(r) for r in rows]
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def get_feed_page(family: str, page: int, version: int) -> List[Dict]:
+    rows = q("""SELECT p.*,
+                       (SELECT COUNT(*) FROM post_likes pl WHERE pl.post_id=p.id) AS like_count,
+                       (SELECT COUNT(*) FROM post_comments pc WHERE pc.post_id=p.id) AS comment_count
+                FROM posts p 
+                WHERE p.family=? 
+                ORDER BY p.id DESC
+                LIMIT ? OFFSET ?""", (family, PAGE_SIZE, page*PAGE_SIZE))
+    return [dict(r) for r in rows]
+
+@st.cache_data(ttl=60, max_entries=64, show_spinner=False)
+def get_albums(family: str, version: int) -> List[Dict]:
+    return [dict(r) for r in q("SELECT * FROM albums WHERE family=? ORDER BY id DESC LIMIT 100", (family,))]
+
+@st.cache_data(ttl=60, max_entries=64, show_spinner=False)
+def get_family_events(family: str, version: int) -> List[Dict]:
+    """Every event of the family, for the calendar's Manage list. The parsed start/end,
+    header stamp and displayed end date ride along, computed once per version rather
+    than per event per rerun (None where a timestamp is missing or unparsable)."""
+    out: List[Dict] = []
+    for r in q("SELECT * FROM events WHERE family=? ORDER BY start_at ASC", (family,)):
+        e = dict(r)
+        sdt, edt = _parse_iso(e["start_at"]), _parse_iso(e["end_at"])
+        e["start_dt"], e["end_dt"] = sdt, edt
+        e["start_label"] = sdt.strftime("%Y-%m-%d %H:%M") if sdt else None
+        # all-day ends are stored exclusive (midnight after the last day)
+        e["end_date"] = ((edt - timedelta(days=1)).date() if e["all_day"] else edt.date()) if edt else None
+        out.append(e)
+    return out
+
+_EVENT_PALETTE = ["#4285F4","#DB4437","#F4B400","#0F9D58","#AB47BC","#00ACC1","#EF6C00","#5C6BC0","#26A69A","#EC407A"]
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def get_calendar_events(family: str, d0: date, d1: date, version: int) -> List[Dict]:
+    """FullCalendar dicts for events starting on d0..d1 (inclusive). The range is an
+    index seek on (family, start_at); ISO strings compare in date order."""
+    rows = q("""SELECT id, title, start_at, end_at, all_day, assignees FROM events
+                WHERE family=? AND start_at >= ? AND start_at < ?
+                ORDER BY start_at ASC""",
+             (family, d0.isoformat(), (d1 + timedelta(days=1)).isoformat()))
+    out: List[Dict] = []
+    for e in rows:
+        if _parse_iso(e["start_at"]) is None:
+            continue
+        color = _EVENT_PALETTE[zlib.crc32((e["assignees"] or "default").encode("utf-8")) % len(_EVENT_PALETTE)]
+        out.append({
+            "id": str(e["id"]),
+            "title": e["title"],
+            "start": e["start_at"],
+            "end":   e["end_at"],
+            "allDay": bool(e["all_day"]),
+            "backgroundColor": color + "80",
+            "borderColor": color,
+            "extendedProps": {"assignees": e["assignees"] or ""},
+        })
+    return out
+
+# Chat rows are plain (id, author, text, created_at) tuples: no sqlite3.Row or dict
+# per message on the hottest (polled) read
+CHAT_ID, CHAT_AUTHOR, CHAT_TEXT, CHAT_TS = range(4)
+
+def chat_token(family: str, room: str) -> Tuple[int, int]:
+    """Change token for one room: (MAX(id), COUNT(*)) moves on every post and delete.
+    Narrower than db_version(), which any write in any tab bumps, so a polled idle room
+    keeps hitting the cache. Both aggregates come off idx_chat_family_room_id alone."""
+    return q_tuples("SELECT COALESCE(MAX(id),0), COUNT(*) FROM chat_messages WHERE family=? AND room=?",
+                    (family, room))[0]
+
+@st.cache_data(ttl=60, max_entries=256, show_spinner=False)
+def get_chat_page(family: str, room: str, before_id: Optional[int], limit: int, version) -> List[Tuple[int, str, str, str]]:
+    """`limit` messages older than `before_id` (None = latest), oldest first.
+    Keyset on the PK instead of OFFSET, so older pages cost the same as the tail."""
+    rows = q_tuples("""SELECT id, author, text, created_at FROM chat_messages 
+                       WHERE family=? AND room=? AND (? IS NULL OR id < ?)
+                       ORDER BY id DESC
+                       LIMIT ?""", (family, room, before_id, before_id, limit))
+    rows.reverse()
+    return rows
+
+def chat_tail(family: str, room: str, limit: int) -> List[Tuple[int, str, str, str]]:
+    """Live tail for this session: a poll with new messages fetches only id > last held,
+    appended and trimmed to `limit`. Anything else (room switch, delete, a row that
+    raced the token) falls back to a full get_chat_page."""
+    token = chat_token(family, room)
+    memo = st.session_state.get("chat_tail")
+    if memo and memo[0] == (family, room):
+        _, (old_max, old_count), msgs = memo
+        if (old_max, old_count) == token:
+            return msgs
+        held = msgs[-1][CHAT_ID] if msgs else 0
+        if held == old_max and token[0] > old_max:
+            new = q_tuples("""SELECT id, author, text, created_at FROM chat_messages
+                              WHERE family=? AND room=? AND id > ? AND id <= ?
+                              ORDER BY id ASC""", (family, room, old_max, token[0]))
+            if old_count + len(new) == token[1]:   # nothing deleted in between
+                msgs = (msgs + new)[-limit:]
+                st.session_state["chat_tail"] = ((family, room), token, msgs)
+                return msgs
+    msgs = get_chat_page(family, room, None, limit, token)
+    st.session_state["chat_tail"] = ((family, room), token, msgs)
+    return msgs
 
 # ==================== UTIL ====================
 import html as _html
-
+# Message/comment bodies are one-off strings: an esc() LRU entry each would only churn
+# the memo, and as element content they don't need quote escaping either
+from html import escape as _esc
+import functools
+
+# The lru_caches below are per run: each rerun re-executes this script and starts
+# them empty. Kept in cache_resource they would pin the first run's function and its
+# globals, so edits to the code or the templates it reads would never take effect.
+# esc() is a pure function of its input, so nothing to invalidate on edit/delete
+@functools.lru_cache(maxsize=4096)
 def esc(s: Optional[str]) -> str:
     return _html.escape(s or "")
 
@@ -478,91 +1034,444 @@ def iso_utc(d: Optional[date], t: Optional[time]) -> Optional[str]:
 def now_iso_utc() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+def normalize_assignees(raw: Optional[str]) -> str:
+    """'Mom,dad , ,Mom' -> 'Mom, dad': trimmed, empties and repeats dropped (first
+    spelling wins, case-insensitively). Every write stores this one canonical form."""
+    seen, names = set(), []
+    for name in (raw or "").split(","):
+        name = name.strip()
+        if name and name.lower() not in seen:
+            seen.add(name.lower()); names.append(name)
+    return ", ".join(names)
+
 def parse_aware(dt_str: str) -> datetime:
     """Parse ISO string and return an aware (UTC) datetime. Treat naive as UTC."""
     if not dt_str:
-        return datetime.now(timezone.utc)
+        return datetime.now(timezone.utc)   # clock-dependent: kept out of the memo
+    return _parse_aware_iso(dt_str)
+
+# Stored timestamps never change, and datetimes are immutable: safe to share
+@functools.lru_cache(maxsize=8192)
+def _parse_aware_iso(dt_str: str) -> datetime:
     dt = datetime.fromisoformat(dt_str)
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
 
+# Naive-or-aware as stored (the calendar keeps local wall-clock times); None if unparsable
+@functools.lru_cache(maxsize=4096)
+def _parse_iso(dt_str: Optional[str]) -> Optional[datetime]:
+    if not dt_str:
+        return None
+    try:
+        return datetime.fromisoformat(dt_str)
+    except (TypeError, ValueError):
+        return None
+
+# ---- note card markup (pure functions of the note's fields: memoised per process) ----
+@functools.lru_cache(maxsize=2048)
+def note_meta_line(assignee: Optional[str], due_at: Optional[str], tags: Optional[str], now_ref: str) -> str:
+    """Caption under a note. now_ref is a minute-granular UTC ISO stamp, so the
+    overdue flag (and the cache key) only moves once a minute."""
+    meta = []
+    if assignee:
+        meta.append(f"👤 {esc(assignee)}")
+    if due_at:
+        try:
+            due_dt = parse_aware(due_at)
+            overdue = due_dt < _parse_aware_iso(now_ref)
+            meta.append(("⏰ " if not overdue else "⚠️ Overdue ") + due_dt.strftime("%b %d %I:%M%p UTC"))
+        except Exception:
+            meta.append("⏰ " + esc(due_at))
+    if tags:
+        meta.append("🏷 " + esc(tags))
+    return " • ".join(meta)
+
+def _text_card_html(content: str, color: str) -> str:
+    return f"<div style='background:{color};padding:10px;border-radius:8px;min-height:80px'>{esc(content)}</div>"
+
+def _link_card_html(url: str, color: str) -> str:
+    return (f"<div style='background:{color};padding:10px;border-radius:8px'>🔗 "
+            f"<a href='{esc(url)}' target='_blank' rel='noopener'>{esc(url)}</a></div>")
+
+def _reminder_card_html(content: str, color: str) -> str:
+    return f"<div style='background:{color};padding:10px;border-radius:8px'>⏰ {esc(content)}</div>"
+
+def comments_html(comments) -> str:
+    """A whole comment thread as one markdown block: one element for the frontend
+    instead of a columns row + markdown + button per comment. created_at is always the
+    column's datetime('now') default, so it goes in unescaped."""
+    return "".join(
+        f"<div style='margin:4px 0'><b>{esc(c['author'])}</b> · {c['created_at']}<br/>{_esc(c['text'] or '', quote=False)}</div>"
+        for c in comments
+    )
+
+# ---- og:image previews for wishlist links ----
+# Only the og:image / twitter:image <meta> is wanted, so a regex over the meta tags
+# replaces a full BeautifulSoup parse; either attribute order is accepted
+_META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.I)
+_META_ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+OG_SCAN_BYTES = 65536   # the tags sit in <head>, well inside this
+
+def _og_from_html(page: str) -> Optional[str]:
+    found: Dict[str, str] = {}
+    for tag in _META_TAG_RE.findall(page):
+        attrs = {k.lower(): a or b for k, a, b in _META_ATTR_RE.findall(tag)}
+        kind = (attrs.get("property") or attrs.get("name") or "").lower()
+        content = _html.unescape(attrs.get("content", "")).strip()
+        if kind in ("og:image", "twitter:image") and content:
+            found.setdefault(kind, content)
+            if kind == "og:image":
+                break
+    return found.get("og:image") or found.get("twitter:image")
+
+# tiny always-works placeholder for wishlist items without a picture
+WISHLIST_PLACEHOLDER_IMG = (
+    "data:image/svg+xml;utf8,"
+    "<svg xmlns='http://www.w3.org/2000/svg' width='150' height='150'>"
+    "<rect width='100%' height='100%' fill='%23eeeeee'/>"
+    "<text x='50%' y='50%' dominant-baseline='middle' text-anchor='middle' "
+    "fill='%23999999' font-family='Arial' font-size='14'>Preview</text>"
+    "</svg>"
+)
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+@functools.lru_cache(maxsize=4096)
+def looks_like_image(url: str) -> bool:
+    return (url or "").lower().split("?", 1)[0].endswith(_IMAGE_EXTS)
+
+# One keep-alive session: repeat lookups on the same store reuse its TCP/TLS connection
+@st.cache_resource(show_spinner=False)
+def _http() -> "requests.Session":
+    import requests
+    sess = requests.Session()
+    sess.headers["User-Agent"] = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                                  "AppleWebKit/537.36 (KHTML, like Gecko) "
+                                  "Chrome/124.0 Safari/537.36")
+    return sess
+
+def lookup_og_image(url: str, sess: "requests.Session") -> Optional[str]:
+    """Best-effort product image for a link (None on any failure). Touches no st.*
+    state, so it can run on the og pool."""
+    if not url or not (url.startswith("http://") or url.startswith("https://")):
+        return None
+    try:
+        from urllib.parse import urljoin
+        # Stream and stop at </head> (or OG_SCAN_BYTES): store pages run to megabytes
+        # and everything after the head is useless here
+        with sess.get(url, timeout=5, stream=True) as r:
+            if r.status_code != 200 or "text/html" not in r.headers.get("Content-Type", ""):
+                return None
+            head = bytearray()
+            for chunk in r.iter_content(8192):
+                head += chunk
+                if len(head) >= OG_SCAN_BYTES or b"</head" in head.lower():
+                    break
+            page = bytes(head[:OG_SCAN_BYTES]).decode(r.encoding or "utf-8", errors="replace")
+        img = _og_from_html(page)
+        # Some sites give relative URLs
+        return urljoin(url, img) if img else None
+    except Exception:
+        return None
+
+# The product-page GET (up to a 5 s timeout) used to block the "Add" rerun. Like the
+# thumbnails: the item is inserted right away and a worker fills image_url in; the
+# next rerun after it commits picks the image up through db_version().
+@st.cache_resource(show_spinner=False)
+def _og_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="hive-og")
+
+def queue_og_image(item_id: int, url: str) -> None:
+    # Resolved here on the script thread; the worker must not call into st.*
+    conn, lock, sess = get_conn(), _write_lock(), _http()
+    def _fill():
+        img = lookup_og_image(url, sess)
+        if img:
+            with lock:
+                retry_locked(lambda: conn.execute(
+                    "UPDATE list_items SET image_url=? WHERE id=? AND image_url IS NULL", (img, item_id)))
+    _og_pool().submit(_fill)
+
+# Magic() loads and compiles the whole magic database; build it once per process.
+# python-magic serializes from_buffer() with its own lock, so sharing is safe.
+@st.cache_resource(show_spinner=False)
+def _magic() -> "magic.Magic":
+    return magic.Magic(mime=True)
+
 def sniff_mime(data: bytes, fallback_ext: str) -> Tuple[str, str]:
     if MAGIC_OK:
         try:
-            m = magic.Magic(mime=True)
-            mime = m.from_buffer(data[:2048])
+            mime = _magic().from_buffer(data[:2048])
         except Exception:
             mime = "application/octet-stream"
     else:
         mime = "application/octet-stream"
         ext_map = {
-            ".jpg":"image/jpeg",".jpeg":"image/jpeg",".png":"image/png",".gif":"image/gif",
+            ".jpg":"image/jpeg",".jpeg":"image/jpeg",".png":"image/png",".gif":"image/gif",".webp":"image/webp",
             ".mp4":"video/mp4",".webm":"video/webm",".mov":"video/quicktime"
         }
         mime = ext_map.get(fallback_ext.lower(), mime)
     if mime in ("image/jpeg","image/jpg"): ext=".jpg"
     elif mime=="image/png": ext=".png"
     elif mime=="image/gif": ext=".gif"
+    elif mime=="image/webp": ext=".webp"
     elif mime=="video/mp4": ext=".mp4"
     elif mime=="video/webm": ext=".webm"
     elif mime=="video/quicktime": ext=".mov"
     else:
-        ext = fallback_ext if fallback_ext.lower() in (".jpg",".jpeg",".png",".gif",".mp4",".webm",".mov") else ".jpg"
+        ext = fallback_ext if fallback_ext.lower() in (".jpg",".jpeg",".png",".gif",".webp",".mp4",".webm",".mov") else ".jpg"
     return mime, ext
 
-def save_image(upload, mime:str, ext:str) -> Tuple[str, Optional[str]]:
-    raw = upload.getbuffer()
-    name = f"{uuid.uuid4().hex}{ext}"
-    out = UPLOAD_DIR / name
-    with open(out, "wb") as f: f.write(raw)
-    thumb_path = None
-    if mime != "image/gif":
-        try:
-            im = Image.open(io.BytesIO(raw))
-            im.info.pop("exif", None)
-            im.thumbnail(THUMB_MAX)
-            thumb = UPLOAD_DIR / f"{out.stem}_thumb.webp"
-            im.save(thumb, "WEBP", quality=70, method=6)
-            thumb_path = str(thumb)
-        except Exception:
-            thumb_path = None
-    return str(out), thumb_path
-
-def save_video(upload, ext:str) -> Tuple[str, Optional[str]]:
-    raw = upload.getbuffer()
-    name = f"{uuid.uuid4().hex}{ext}"
-    out = UPLOAD_DIR / name
-    with open(out, "wb") as f: f.write(raw)
-    thumb_path = None
-    if MOVIEPY_OK:
+def _new_hasher():
+    # blake3 (SIMD, multithreaded on big inputs) when installed; blake2b is stdlib
+    return blake3.blake3(max_threads=blake3.blake3.AUTO) if BLAKE3_OK else hashlib.blake2b(digest_size=16)
+
+def _stream_to_store(upload) -> Tuple[Path, str]:
+    """Copy the upload to a temp file in 1 MB chunks, hashing as it goes; returns
+    (temp_path, digest). Never holds the whole file as one Python bytes object."""
+    h = _new_hasher()
+    tmp = UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
+    upload.seek(0)
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter(lambda: upload.read(1 << 20), b""):
+                h.update(chunk); f.write(chunk)
+    except BaseException:
+        tmp.unlink(missing_ok=True)   # disk full / read error: don't strand a .part file
+        raise
+    return tmp, h.hexdigest()
+
+def _commit_upload(tmp: Path, out: Path) -> str:
+    if out.exists():
+        tmp.unlink(missing_ok=True)   # same bytes already stored
+    else:
+        os.replace(tmp, out)
+    return str(out)
+
+# Originals are stored under their content digest, so re-uploading the same photo
+# (common from phones) points the new post_media row at the existing file instead
+# of writing/converting it again. Nothing deletes single files, so sharing is safe.
+def save_image(upload, mime:str, ext:str) -> Tuple[str, str]:
+    """Stills are re-encoded to WebP (~3x smaller than camera JPEG/PNG); returns (path, mime)."""
+    tmp, digest = _stream_to_store(upload)
+    if WEBP_OK and mime in ("image/jpeg", "image/png"):
+        out = UPLOAD_DIR / f"{digest}.webp"
+        if out.exists():
+            tmp.unlink(missing_ok=True)
+            return str(out), "image/webp"
         try:
-            clip = VideoFileClip(str(out))
-            frame = clip.get_frame(0.0)
-            im = Image.fromarray(frame)
-            im.thumbnail(THUMB_MAX)
-            thumb = UPLOAD_DIR / f"{out.stem}_thumb.webp"
-            im.save(thumb, "WEBP", quality=70, method=6)
-            thumb_path = str(thumb)
-            clip.reader.close(); clip.close()
+            with Image.open(tmp) as src:
+                im = ImageOps.exif_transpose(src)   # bake in rotation, drop EXIF
+                im = im.convert("RGBA" if "A" in im.getbands() or "transparency" in im.info else "RGB")
+            im.save(out, "WEBP", quality=82, method=4)   # 6 costs ~2x the CPU for a few % smaller
+            tmp.unlink(missing_ok=True)
+            return str(out), "image/webp"
         except Exception:
-            thumb_path = None
-    return str(out), thumb_path
+            pass   # undecodable/odd file: keep the original bytes
+    return _commit_upload(tmp, UPLOAD_DIR / f"{digest}{ext}"), mime
+
+def save_video(upload, ext:str) -> str:
+    tmp, digest = _stream_to_store(upload)
+    return _commit_upload(tmp, UPLOAD_DIR / f"{digest}{ext}")
 
-def save_media(upload) -> Tuple[str, Optional[str], str, str]:
-    raw = upload.getbuffer()
-    if len(raw) > MAX_MB * 1024 * 1024:
+def save_media(upload) -> Tuple[str, str, str]:
+    """Validate + write the original; returns (path, mime, media_type). Thumbnails via queue_thumb()."""
+    if upload.size > MAX_MB * 1024 * 1024:
         st.error(f"File too large (> {MAX_MB}MB)."); st.stop()
+    upload.seek(0)
+    head = upload.read(2048)   # enough for magic sniffing
+    upload.seek(0)
     _, ext = os.path.splitext(upload.name)
-    mime, ext2 = sniff_mime(raw, ext or ".jpg")
+    mime, ext2 = sniff_mime(head, ext or ".jpg")
     if mime not in ALLOWED_MIMES:
         st.error("Unsupported file type."); st.stop()
     if mime in IMG_MIMES:
-        path, thumb = save_image(upload, mime, ext2)
-        return path, thumb, mime, "image"
+        path, mime = save_image(upload, mime, ext2)
+        return path, mime, "image"
+    else:
+        return save_video(upload, ext2), mime, "video"
+
+# ---------- background thumbnails ----------
+# Decode/resize/encode (and any video frame grab) runs on a worker pool, never on
+# the script thread. The row is inserted with the thumbnail's final path up front;
+# until the worker has written it the UI falls back to the original.
+@st.cache_resource(show_spinner=False)
+def _thumb_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="hive-thumb")
+
+def thumb_path_for(path: str) -> Path:
+    # Originals are digest-named, so the stem already identifies the content
+    return UPLOAD_DIR / f"thumb_{Path(path).stem}.webp"
+
+def _downscale(im: Image.Image) -> Image.Image:
+    """Fit inside THUMB_MAX; OpenCV's INTER_AREA (SIMD) when available, else Pillow."""
+    w, h = im.size
+    scale = min(THUMB_MAX[0] / w, THUMB_MAX[1] / h)
+    if scale >= 1:
+        return im
+    if CV2_OK and im.mode in ("RGB", "RGBA", "L"):
+        target = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return Image.fromarray(cv2.resize(np.asarray(im), target, interpolation=cv2.INTER_AREA))
+    im.thumbnail(THUMB_MAX, Image.Resampling.BILINEAR)   # shown small; LANCZOS isn't worth it
+    return im
+
+def _first_video_frame(src: Path) -> Optional[Image.Image]:
+    # Cheapest first: OpenCV decodes one frame in-process; the ffmpeg CLI is one
+    # short subprocess; moviepy (full clip reader) only as a last resort
+    if CV2_OK:
+        cap = cv2.VideoCapture(str(src))
+        try:
+            ok, frame = cap.read()
+        finally:
+            cap.release()
+        if ok:
+            return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    if FFMPEG_BIN:
+        try:
+            out = subprocess.run(
+                [FFMPEG_BIN, "-v", "error", "-ss", "0", "-i", str(src), "-frames:v", "1",
+                 "-f", "image2pipe", "-vcodec", "png", "-"],
+                capture_output=True, timeout=30, check=True,
+            ).stdout
+            if out:
+                return Image.open(io.BytesIO(out))
+        except Exception:
+            pass
+    if MOVIEPY_OK:
+        clip = VideoFileClip(str(src))
+        try:
+            return Image.fromarray(clip.get_frame(0.0))
+        finally:
+            clip.reader.close(); clip.close()
+    return None
+
+def _render_thumb(path: str, media_type: str) -> Optional[str]:
+    # Content-addressed: the same upload (re-posted, or re-queued after a restart)
+    # reuses the existing file instead of being decoded and encoded again
+    src = Path(path)
+    try:
+        thumb = thumb_path_for(path)
+        if thumb.exists():
+            return str(thumb)
+        if media_type == "video":
+            im = _first_video_frame(src)
+            if im is None:
+                return None
+        else:
+            im = Image.open(src)
+            if im.format == "JPEG":
+                im.draft("RGB", THUMB_MAX)   # libjpeg decodes at 1/2..1/8 scale, no full-size pass
+            # Orientation first (the thumb drops EXIF, so it must be baked in), then strip
+            im = ImageOps.exif_transpose(im)
+            im.info.pop("exif", None)
+        # Write-then-rename: the feed may check for this path while we encode
+        part = thumb.with_name(f".{thumb.name}.{uuid.uuid4().hex}.part")
+        _downscale(im).save(part, "WEBP", quality=70, method=4)
+        os.replace(part, thumb)
+        return str(thumb)
+    except Exception:
+        return None
+
+# Existence checks for rendered media. Uploads only appear together with the DB row
+# that points at them (and the factory reset wipes both), so one scandir per
+# db_version replaces a stat() per photo per rerun.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _upload_names(version: int) -> frozenset:
+    try:
+        with os.scandir(UPLOAD_DIR) as it:
+            return frozenset(e.name for e in it)
+    except OSError:
+        return frozenset()
+
+def upload_exists(path: Optional[str], version: int) -> bool:
+    if not path:
+        return False
+    head, name = os.path.split(path)
+    if head == str(UPLOAD_DIR):
+        return name in _upload_names(version)
+    return os.path.exists(path)   # legacy / outside the upload dir: ask the FS
+
+def queue_thumb(path: str, mime: str, media_type: str) -> Optional[str]:
+    """Schedule the thumbnail and return the path it will land at (None for GIFs)."""
+    if mime == "image/gif":   # keep GIFs animated; no still thumbnail
+        return None
+    _thumb_pool().submit(_render_thumb, path, media_type)
+    return str(thumb_path_for(path))
+
+# ---- per-type note renderers: one dict lookup per note instead of an if/elif chain ----
+def _render_text_note(n, version: int) -> None:
+    st.markdown(_text_card_html(n["content"] or "", n["color"]), unsafe_allow_html=True)
+
+def _render_link_note(n, version: int) -> None:
+    url = n["content"] or ""
+    if url.startswith("http://") or url.startswith("https://"):
+        st.markdown(_link_card_html(url, n["color"]), unsafe_allow_html=True)
+    else:
+        st.warning("Invalid link.")
+
+def _render_photo_note(n, version: int) -> None:
+    if upload_exists(n["content"], version):
+        st.image(n["content"], use_container_width=True, caption="Photo sticky")
     else:
-        path, thumb = save_video(upload, ext2)
-        return path, thumb, mime, "video"
+        st.warning("Photo missing on disk.")
+
+def _render_reminder_note(n, version: int) -> None:
+    st.markdown(_reminder_card_html(n["content"] or "", n["color"]), unsafe_allow_html=True)
+
+NOTE_RENDERERS = {
+    None: _render_text_note, "text": _render_text_note, "link": _render_link_note,
+    "photo": _render_photo_note, "reminder": _render_reminder_note,
+}
+
+# Drag-board mini cards (streamlit-elements); anything unrecognised shows as text
+def _mini_text(n, version: int) -> None:
+    txt = (n["content"] or "")[:240]
+    mui.Typography(txt + ("…" if len(n["content"] or "") > 240 else ""))
+
+def _mini_link(n, version: int) -> None:
+    mui.Link(n["content"], href=n["content"], target="_blank", rel="noopener")
+
+def _mini_photo(n, version: int) -> None:
+    if upload_exists(n["content"], version):
+        html.img(src=n["content"], style={"width": "100%", "borderRadius": "6px"})
+    else:
+        _mini_text(n, version)
+
+MINI_RENDERERS = {"link": _mini_link, "photo": _mini_photo}
+
+# One statement for all three RSVP buttons: the status is a bound value, so
+# sqlite3 prepares (and caches) a single statement instead of three
+RSVP_UPSERT_SQL = """INSERT INTO event_rsvps(event_id, username, status) VALUES(?,?,?)
+                     ON CONFLICT(event_id, username)
+                     DO UPDATE SET status=excluded.status, responded_at=datetime('now')"""
+RSVP_CHOICES = (("going", "✅ Going", "go"), ("maybe", "🤔 Maybe", "maybe"), ("cant", "❌ Can't", "cant"))
+
+# Attendee chips: fixed markup, so plain format strings filled from escaped fields
+# (inline styles: no external CSS dependency; the avatar is always 32×32)
+CHIP_TMPL = ("<span style='display:inline-flex;align-items:center;gap:8px;padding:6px 10px;"
+             "border-radius:999px;border:1px solid {bcol};margin:2px;font-size:13px;line-height:1;'>"
+             "<span style='display:inline-block;width:32px;height:32px;border-radius:50%;overflow:hidden'>"
+             "{avatar}</span><span>{name}</span><span style='opacity:0.7'>· {status}</span></span>")
+AVATAR_IMG_TMPL = "<img src='{src}' style='width:100%;height:100%;object-fit:cover;'/>"
+AVATAR_INITIALS_TMPL = ("<span style='width:100%;height:100%;display:flex;align-items:center;justify-content:center;"
+                        "background:#888;color:#fff;font-size:14px;font-weight:600'>{initials}</span>")
+RSVP_CHIP_BORDER = {"going": "#1b5e20", "maybe": "#9e7500"}   # anything else: red-ish #7b1c1c
+RSVP_LABELS = {"going": "Going", "maybe": "Maybe", "cant": "Can't"}
+
+@functools.lru_cache(maxsize=1024)
+def attendee_chip_html(full: str, status: str, avatar_src: str) -> str:
+    """One RSVP chip; avatar_src is "" when there is no (existing) avatar file."""
+    if avatar_src:
+        avatar = AVATAR_IMG_TMPL.format_map({"src": esc(avatar_src)})
+    else:
+        initials = "".join(part[0].upper() for part in full.split()[:2]) or "?"
+        avatar = AVATAR_INITIALS_TMPL.format_map({"initials": esc(initials)})
+    return CHIP_TMPL.format_map({
+        "bcol": RSVP_CHIP_BORDER.get(status, "#7b1c1c"),
+        "avatar": avatar,
+        "name": esc(full),
+        "status": RSVP_LABELS.get(status, status),   # CHECK-constrained to the three keys
+    })
 
 # ==================== APP BOOTSTRAP (paste this block) ====================
 import streamlit as st
@@ -572,6 +1481,7 @@ st.set_page_config(page_title="🐝 The Hive", layout="wide")
 # 1) Make sure ALL tables exist first
 init_schema()          # core tables
 _init_addon_schema()   # addon tables (app_settings, users, profiles, RSVPs, ...)
+start_db_maintenance() # weekly VACUUM, WAL checkpoints, PRAGMA optimize at exit
 
 # 2) Theme CSS (safe after tables exist)
 _theme_css()
@@ -606,100 +1516,13 @@ if st.session_state.get("auth") and user_epoch != current_epoch:
 
 # === ADD-ON BLOCK B: Boot the add-on schema + sticky user + theme CSS ===
 _init_addon_schema()          # create add-on tables if missing
-_theme_css()                  # inject contrast-safe CSS for light/dark
+# theme CSS (incl. the old B++ dark-theme fix) is linked once by the bootstrap above
 # ---- Session defaults (since sticky bootstrap was removed)
 if "user" not in st.session_state:
     st.session_state["user"] = "Guest"
 if "family" not in st.session_state:
     st.session_state["family"] = "public"
 # === END ADD-ON BLOCK B ===
-# === ADD-ON BLOCK B++ : Max-contrast dark theme fix ===
-st.markdown("""
-<style>
-/* Target Streamlit's dark theme both by data attr and media query */
-html[data-theme="dark"], @media (prefers-color-scheme: dark) {
-}
-
-/* Global text */
-html[data-theme="dark"] .stApp,
-html[data-theme="dark"] .stApp * {
-  color: #e9e9e9 !important;
-}
-
-/* Markdown paragraphs, captions, labels */
-html[data-theme="dark"] .stApp [data-testid="stMarkdown"] p,
-html[data-theme="dark"] .stApp .stCaption,
-html[data-theme="dark"] .stApp label,
-html[data-theme="dark"] .stApp details > summary {
-  color: #e9e9e9 !important;
-}
-
-/* Text inputs, text areas, date/time inputs */
-html[data-theme="dark"] .stApp [data-baseweb="base-input"] input,
-html[data-theme="dark"] .stApp textarea,
-html[data-theme="dark"] .stApp [data-testid="stTextArea"] textarea,
-html[data-theme="dark"] .stApp [data-testid="stDateInput"] input,
-html[data-theme="dark"] .stApp [data-testid="stTimeInput"] input {
-  color: #e9e9e9 !important;
-  border-color: #666 !important;
-  background: transparent !important;
-}
-
-/* Placeholders */
-html[data-theme="dark"] .stApp input::placeholder,
-html[data-theme="dark"] .stApp textarea::placeholder {
-  color: #bbbbbb !important;
-}
-
-/* Selectbox and multiselect rendered area */
-html[data-theme="dark"] .stApp [data-testid="stSelectbox"] div,
-html[data-theme="dark"] .stApp [data-testid="stMultiSelect"] div[role="combobox"] {
-  color: #e9e9e9 !important;
-}
-
-/* Radio / Checkbox labels */
-html[data-theme="dark"] .stApp [role="radiogroup"],
-html[data-theme="dark"] .stApp [role="checkbox"] {
-  color: #e9e9e9 !important;
-}
-
-/* File uploader */
-html[data-theme="dark"] .stApp [data-testid="stFileUploaderDropzone"] {
-  color: #e9e9e9 !important;
-  border-color: #666 !important;
-  background: rgba(255,255,255,0.02) !important;
-}
-
-/* Expander borders / hr lines */
-html[data-theme="dark"] .stApp hr,
-html[data-theme="dark"] .stApp .st-emotion-cache-hr {
-  border-color: #444 !important;
-}
-
-/* Buttons: ensure text is visible on dark backgrounds */
-html[data-theme="dark"] .stApp button[kind="primary"],
-html[data-theme="dark"] .stApp button {
-  color: #f5f5f5 !important;
-}
-
-/* Sidebar parity */
-html[data-theme="dark"] .stApp [data-testid="stSidebar"] * {
-  color: #e9e9e9 !important;
-}
-
-/* Tabs text */
-html[data-theme="dark"] .stApp [data-baseweb="tab"] {
-  color: #e9e9e9 !important;
-}
-
-/* Chips we added for RSVP */
-html[data-theme="dark"] .stApp .chip {
-  border-color: #555 !important;
-  color: #e9e9e9 !important;
-}
-</style>
-""", unsafe_allow_html=True)
-# === END ADD-ON BLOCK B++ ===
 # === ADD-ON BLOCK F (REPLACEMENT): Password-gated Factory Reset ===
 def _factory_reset_ui_secured():
     with st.sidebar.expander("🧨 Admin · Factory Reset", expanded=False):
@@ -734,34 +1557,14 @@ def _factory_reset_ui_secured():
             if txt.strip() == "RESET":
                 try:
                     # Clear DB tables instead of deleting file to keep schema
-                    exec1("DELETE FROM reactions", ())
-                    exec1("DELETE FROM comments", ())
-                    exec1("DELETE FROM list_items", ())
-                    exec1("DELETE FROM lists", ())
-                    exec1("DELETE FROM documents", ())
-                    exec1("DELETE FROM notes", ())
-                    exec1("DELETE FROM post_comments", ())
-                    exec1("DELETE FROM post_likes", ())
-                    exec1("DELETE FROM post_media", ())
-                    exec1("DELETE FROM posts", ())
-                    exec1("DELETE FROM albums", ())
-                    exec1("DELETE FROM chat_messages", ())
-                    exec1("DELETE FROM event_rsvps", ())
-                    exec1("DELETE FROM events", ())
-                    exec1("DELETE FROM user_profiles", ())
-                    exec1("DELETE FROM app_settings", ())
-                    exec1("DELETE FROM users", ())   # <-- wipe all user accounts
+                    _wipe_all_tables(include_users=True)   # <-- also wipes all user accounts
 
                     # Rotate global session epoch to force logout
                     from uuid import uuid4
                     _set_setting("__GLOBAL__", "session_epoch", str(uuid4()))
 
                     # Nuke uploaded files
-                    try:
-                        for p in UPLOAD_DIR.glob("*"):
-                            p.unlink(missing_ok=True)
-                    except Exception:
-                        pass
+                    _purge_uploads()
 
                     # Optimize database
                     exec1("VACUUM", ())
@@ -803,8 +1606,9 @@ with st.sidebar:
 
         if do_register and u and p:
             try:
-                _create_user(FAMILY, u, p)
-                _get_or_create_profile(FAMILY, u)
+                with tx():   # account and profile land together or not at all
+                    _create_user(FAMILY, u, p)
+                    _get_or_create_profile(FAMILY, u)
                 st.success("Account created — now click Sign in.")
             except sqlite3.IntegrityError:
                 st.error("That username already exists in this family.")
@@ -848,9 +1652,10 @@ with st.sidebar:
 
     st.markdown("---")
     st.caption("Corkboard filters")
-    f_search = st.text_input("Search text")
-    f_assignee = st.text_input("Assignee contains")
-    f_tags = st.text_input("Tags contains")
+    # Word-prefix matching (notes_fts): "pick" finds "pick up milk", "ick" doesn't
+    f_search = st.text_input("Search words starting with")
+    f_assignee = st.text_input("Assignee starts with")
+    f_tags = st.text_input("Tags start with")
     f_due = st.selectbox("Due filter", ["All", "Due today", "Overdue"])
 
     # ✅ Secure reset button
@@ -890,7 +1695,7 @@ with tabs[0]:
             elif type_choice == "link":
                 content_text = st.text_input("URL (http/https only)", placeholder="https://…")
             elif type_choice == "photo":
-                upload = st.file_uploader("Photo", type=["png", "jpg", "jpeg", "gif"])
+                upload = st.file_uploader("Photo", type=["png", "jpg", "jpeg", "gif", "webp"])
             else:
                 content_text = st.text_input("Reminder text", placeholder="Take out trash")
 
@@ -914,7 +1719,7 @@ with tabs[0]:
             if type_choice == "photo":
                 if upload is None:
                     st.error("Please upload a photo."); st.stop()
-                path, thumb, mime, _ = save_media(upload)
+                path, mime, _ = save_media(upload)
                 if mime not in IMG_MIMES:
                     st.error("Only images allowed for photo sticky."); st.stop()
                 content_text = path
@@ -930,31 +1735,32 @@ with tabs[0]:
             row = q("SELECT COALESCE(MAX(order_index),0) m FROM notes WHERE family=? AND deleted_at IS NULL", (FAMILY,))
             next_ord = (row[0]["m"] or 0) + 1
 
-            # Always insert the sticky
-            exec1(
-                """INSERT INTO notes(content,color,x,y,z,type,assignee,due_at,tags,family,order_index)
-                   VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
-                (content_text, color, 40, 40, next_ord, type_choice,
-                 assignee or None, due_iso, tags or None, FAMILY, next_ord)
-            )
-
-            # Optional calendar insert
-            if add_to_calendar:
-                # Prefer a friendly title (avoid long file paths for photos)
-                event_title = (content_text if type_choice != "photo" else "Photo sticky").strip() or "Sticky"
-                if due_iso:
-                    all_day_flag = 1 if due_t is None else 0
-                    start_at = due_iso
-                else:
-                    from datetime import date
-                    all_day_flag = 1
-                    start_at = iso_utc(date.today(), None)
+            with tx():   # sticky and its calendar entry commit together
+                # Always insert the sticky
                 exec1(
-                    """INSERT INTO events(title, start_at, all_day, assignees, family)
-                       VALUES(?,?,?,?,?)""",
-                    (event_title, start_at, all_day_flag, assignee or "", FAMILY)
+                    """INSERT INTO notes(content,color,x,y,z,type,assignee,due_at,tags,family,order_index)
+                       VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
+                    (content_text, color, 40, 40, next_ord, type_choice,
+                     assignee or None, due_iso, tags or None, FAMILY, next_ord)
                 )
 
+                # Optional calendar insert
+                if add_to_calendar:
+                    # Prefer a friendly title (avoid long file paths for photos)
+                    event_title = (content_text if type_choice != "photo" else "Photo sticky").strip() or "Sticky"
+                    if due_iso:
+                        all_day_flag = 1 if due_t is None else 0
+                        start_at = due_iso
+                    else:
+                        from datetime import date
+                        all_day_flag = 1
+                        start_at = iso_utc(date.today(), None)
+                    exec1(
+                        """INSERT INTO events(title, start_at, all_day, assignees, family)
+                           VALUES(?,?,?,?,?)""",
+                        (event_title, start_at, all_day_flag, normalize_assignees(assignee), FAMILY)
+                    )
+
             # Make sure the new sticky is visible (page 0, no filters hiding it)
             st.session_state["notes_page"] = 0
             st.success("Note added.")
@@ -962,37 +1768,29 @@ with tabs[0]:
 
     # Pagination + fetch
     page = st.session_state.get("notes_page", 0)
-    notes = q(
-        """SELECT * FROM notes
-           WHERE family=? AND (deleted_at IS NULL)
-             AND (?='' OR LOWER(content) LIKE '%'||LOWER(?)||'%')
-             AND (?='' OR LOWER(COALESCE(assignee,'')) LIKE '%'||LOWER(?)||'%')
-             AND (?='' OR LOWER(COALESCE(tags,'')) LIKE '%'||LOWER(?)||'%')
-           ORDER BY order_index DESC, id DESC
-           LIMIT ? OFFSET ?""",
-        (FAMILY, f_search or "", f_search or "",
-         f_assignee or "", f_assignee or "",
-         f_tags or "", f_tags or "",
-         PAGE_SIZE, page * PAGE_SIZE)
-    )
-
-    # Apply due-date filter (client side)
-    def include_due(n):
-        if f_due == "All":
-            return True
-        if not n["due_at"]:
-            return False
-        try:
-            dt = parse_aware(n["due_at"])
-        except Exception:
-            return False
-        if f_due == "Due today":
-            return dt.date() == datetime.now(timezone.utc).date()
-        elif f_due == "Overdue":
-            return dt < datetime.now(timezone.utc)
-        return True
-
-    notes = [n for n in notes if include_due(n)]
+    # One clock read per render. The references are coarsened (day / minute) so they
+    # don't defeat get_notes_page's cache or the note_meta_line memo
+    now_utc = datetime.now(timezone.utc)
+    now_minute = now_utc.replace(second=0, microsecond=0).isoformat()
+    due_ref = {"Due today": now_utc.date().isoformat(), "Overdue": now_minute}.get(f_due, "")
+    notes_version = db_version()
+    notes = get_notes_page(FAMILY, f_search or "", f_assignee or "", f_tags or "", page, notes_version,
+                           f_due, due_ref)
+
+    # Reaction counts and comments for the whole page: two IN (...) queries
+    # instead of two per note
+    note_ids = [n["id"] for n in notes]
+    react_map: Dict[int, Dict[str, int]] = {nid: {} for nid in note_ids}
+    comments_by_note: Dict[int, list] = {nid: [] for nid in note_ids}
+    if note_ids:
+        ph = ",".join("?" * len(note_ids))
+        for nid, emoji, cnt in q_tuples(
+                f"SELECT note_id, emoji, COUNT(*) FROM reactions WHERE note_id IN ({ph}) GROUP BY note_id, emoji",
+                note_ids):
+            react_map[nid][emoji] = cnt
+        for c in q(f"SELECT * FROM comments WHERE note_id IN ({ph}) ORDER BY note_id, id DESC", note_ids):
+            if len(comments_by_note[c["note_id"]]) < 50:
+                comments_by_note[c["note_id"]].append(c)
 
     # Drag board (optional streamlit-elements)
     st.markdown("#### Drag notes on the board (positions are saved)")
@@ -1017,45 +1815,55 @@ with tabs[0]:
                         sx={"p": 1, "backgroundColor": n["color"], "overflow": "hidden", "cursor": "grab"}
                     ):
                         mui.Typography((n["type"] or "text").capitalize(), variant="caption")
-                        if n["type"] == "link":
-                            mui.Link(n["content"], href=n["content"], target="_blank", rel="noopener")
-                        elif n["type"] == "photo" and os.path.exists(n["content"]):
-                            html.img(src=n["content"], style={"width": "100%", "borderRadius": "6px"})
-                        else:
-                            txt = (n["content"] or "")[:240]
-                            mui.Typography(txt + ("…" if len(n["content"] or "") > 240 else ""))
-
-        # Persist positions after drag
-        for state_key in ["elements/corkboard_grid", "corkboard_grid"]:
-            if state_key in st.session_state and "layout" in st.session_state[state_key]:
-                for item in st.session_state[state_key]["layout"]:
-                    nid = int(item["i"])
-                    x_px = item["x"] * 80
-                    y_px = item["y"] * 60
-                    exec1("UPDATE notes SET x=?, y=? WHERE id=? AND family=?", (x_px, y_px, nid, FAMILY))
-                break
+                        MINI_RENDERERS.get(n["type"], _mini_text)(n, notes_version)
 
-        st.caption("Positions auto-save. Need to force it?")
-        if st.button("💾 Save layout now"):
+        # Persist positions after drag: only notes that actually moved, one commit for all.
+        # The grid state outlives the page it was built for, so also remember what this
+        # session last wrote; otherwise notes from another page get rewritten every rerun
+        shown_pos = {n["id"]: (n["x"], n["y"]) for n in notes}
+
+        def save_layout_from_state(force: bool = False) -> int:
+            """Write the grid's positions back to notes; returns rows written.
+            force=True rewrites every item, moved or not."""
+            last_written = st.session_state.setdefault("_last_layout", {})
             for state_key in ["elements/corkboard_grid", "corkboard_grid"]:
                 if state_key in st.session_state and "layout" in st.session_state[state_key]:
+                    moved = {}
                     for item in st.session_state[state_key]["layout"]:
                         nid = int(item["i"])
-                        x_px = item["x"] * 80
-                        y_px = item["y"] * 60
-                        exec1("UPDATE notes SET x=?, y=? WHERE id=? AND family=?", (x_px, y_px, nid, FAMILY))
+                        pos = (item["x"] * 80, item["y"] * 60)
+                        if force or (pos != shown_pos.get(nid) and pos != last_written.get(nid)):
+                            moved[nid] = pos   # keyed by id: a repeated item coalesces to one UPDATE
+                    if moved:
+                        exec_many("UPDATE notes SET x=?, y=? WHERE id=? AND family=?",
+                                  [(x, y, nid, FAMILY) for nid, (x, y) in moved.items()])
+                        last_written.update(moved)
+                    return len(moved)
+            return 0
+
+        save_layout_from_state()
+
+        st.caption("Positions auto-save. Need to force it?")
+        if st.button("💾 Save layout now"):
+            save_layout_from_state(force=True)
             st.success("Layout saved.")
     elif not ELEMENTS_OK:
         st.info("Install `pip install streamlit-elements` to drag notes freely (optional).")
 
-    # Pager controls
+    # Pager controls (the total is only known without filters)
+    filtered = bool(f_search or f_assignee or f_tags) or f_due != "All"
+    total = None if filtered else get_counter(f"notes_active:{FAMILY}")
+    has_next = len(notes) >= PAGE_SIZE if total is None else (page + 1) * PAGE_SIZE < total
     c1, c2, c3 = st.columns(3)
     with c1:
         if st.button("◀ Prev", disabled=page == 0, key="notes_prev"):
             st.session_state["notes_page"] = max(0, page - 1)
             st.rerun()
+    with c2:
+        if total is not None:
+            st.caption(f"Page {page + 1} of {max(1, -(-total // PAGE_SIZE))} · {total} notes")
     with c3:
-        if st.button("Next ▶", disabled=len(notes) < PAGE_SIZE, key="notes_next"):
+        if st.button("Next ▶", disabled=not has_next, key="notes_next"):
             st.session_state["notes_page"] = page + 1
             st.rerun()
 
@@ -1067,50 +1875,16 @@ with tabs[0]:
         for i, n in enumerate(notes):
             with cols[i % 2]:
                 with st.container(border=True):
-                    meta = []
-                    if n["assignee"]:
-                        meta.append(f"👤 {esc(n['assignee'])}")
-                    if n["due_at"]:
-                        try:
-                            due_dt = parse_aware(n["due_at"])
-                            overdue = due_dt < datetime.now(timezone.utc)
-                            meta.append(("⏰ " if not overdue else "⚠️ Overdue ") + due_dt.strftime("%b %d %I:%M%p UTC"))
-                        except Exception:
-                            meta.append("⏰ " + esc(n["due_at"]))
-                    if n["tags"]:
-                        meta.append("🏷 " + esc(n["tags"]))
+                    meta = note_meta_line(n["assignee"], n["due_at"], n["tags"], now_minute)
                     if meta:
-                        st.caption(" • ".join(meta))
+                        st.caption(meta)
 
-                    if n["type"] in (None, "text"):
-                        st.markdown(
-                            f"<div style='background:{n['color']};padding:10px;border-radius:8px;min-height:80px'>{esc(n['content'])}</div>",
-                            unsafe_allow_html=True
-                        )
-                    elif n["type"] == "link":
-                        url = n["content"]
-                        if url.startswith("http://") or url.startswith("https://"):
-                            st.markdown(
-                                f"<div style='background:{n['color']};padding:10px;border-radius:8px'>🔗 "
-                                f"<a href='{esc(url)}' target='_blank' rel='noopener'>{esc(url)}</a></div>",
-                                unsafe_allow_html=True
-                            )
-                        else:
-                            st.warning("Invalid link.")
-                    elif n["type"] == "photo":
-                        if os.path.exists(n["content"]):
-                            st.image(n["content"], use_container_width=True, caption="Photo sticky")
-                        else:
-                            st.warning("Photo missing on disk.")
-                    elif n["type"] == "reminder":
-                        st.markdown(
-                            f"<div style='background:{n['color']};padding:10px;border-radius:8px'>⏰ {esc(n['content'])}</div>",
-                            unsafe_allow_html=True
-                        )
+                    render = NOTE_RENDERERS.get(n["type"])
+                    if render:
+                        render(n, notes_version)
 
                     # Reactions + comments
-                    rx = q("SELECT emoji, COUNT(*) c FROM reactions WHERE note_id=? GROUP BY emoji", (n["id"],))
-                    counts = {row["emoji"]: row["c"] for row in rx}
+                    counts = react_map.get(n["id"], {})
                     if counts:
                         st.caption(" ".join([f"{e} {counts.get(e, 0)}" for e in EMOJI_CHOICES if e in counts]))
 
@@ -1119,12 +1893,15 @@ with tabs[0]:
                         for col, emoji in zip(ecols, EMOJI_CHOICES):
                             with col:
                                 if st.button(emoji, key=f"react_{emoji}_{n['id']}"):
-                                    try:
-                                        exec1("INSERT INTO reactions(note_id, emoji, author) VALUES(?,?,?)",
-                                              (n["id"], emoji, DISPLAY_NAME))
-                                    except sqlite3.IntegrityError:
-                                        exec1("DELETE FROM reactions WHERE note_id=? AND emoji=? AND author=?",
-                                              (n["id"], emoji, DISPLAY_NAME))
+                                    # Toggle: rowcount 0 means uniq_rx already had it
+                                    with tx():
+                                        added = exec1(
+                                            """INSERT INTO reactions(note_id, emoji, author) VALUES(?,?,?)
+                                               ON CONFLICT(note_id, emoji, author) DO NOTHING""",
+                                            (n["id"], emoji, DISPLAY_NAME)).rowcount
+                                        if not added:
+                                            exec1("DELETE FROM reactions WHERE note_id=? AND emoji=? AND author=?",
+                                                  (n["id"], emoji, DISPLAY_NAME))
                                     st.rerun()
                         if st.button("Clear all reactions", key=f"clear_rx_{n['id']}"):
                             exec1("DELETE FROM reactions WHERE note_id=?", (n["id"],))
@@ -1137,10 +1914,12 @@ with tabs[0]:
                                       (n["id"], DISPLAY_NAME, txt.strip()))
                                 st.rerun()
 
-                        com = q("SELECT * FROM comments WHERE note_id=? ORDER BY id DESC LIMIT 50", (n["id"],))
+                        com = comments_by_note.get(n["id"], [])
                         if not com:
                             st.caption("No comments yet.")
-                        else:
+                        elif not st.checkbox("Manage comments", key=f"manage_comments_{n['id']}"):
+                            st.markdown(comments_html(com), unsafe_allow_html=True)
+                        else:   # per-comment rows only when someone wants the delete buttons
                             for c in com:
                                 row = st.columns([6, 1])
                                 with row[0]:
@@ -1163,14 +1942,13 @@ with tabs[0]:
                             if st.button("Create Event from Reminder", key=f"note2event_{n['id']}"):
                                 s_iso = iso_utc(ev_d, None if all_day else ev_s)
                                 e_iso = iso_utc(ev_d, None if all_day else ev_e)
-                                exec1(
-                                    """INSERT INTO events(title, start_at, end_at, all_day, assignees, family)
-                                       VALUES(?,?,?,?,?,?)""",
-                                    (n["content"], s_iso, e_iso, 1 if all_day else 0, n["assignee"] or "", FAMILY)
-                                )
-                                new_ev = q("SELECT id FROM events WHERE family=? ORDER BY id DESC LIMIT 1", (FAMILY,))
-                                if new_ev:
-                                    exec1("UPDATE notes SET linked_event_id=? WHERE id=?", (new_ev[0]["id"], n["id"]))
+                                with tx():   # lastrowid is this insert's id, whoever else is writing
+                                    new_ev_id = exec1(
+                                        """INSERT INTO events(title, start_at, end_at, all_day, assignees, family)
+                                           VALUES(?,?,?,?,?,?)""",
+                                        (n["content"], s_iso, e_iso, 1 if all_day else 0, normalize_assignees(n["assignee"]), FAMILY)
+                                    ).lastrowid
+                                    exec1("UPDATE notes SET linked_event_id=? WHERE id=?", (new_ev_id, n["id"]))
                                 st.success("Event created."); st.rerun()
 
                         if n["linked_event_id"]:
@@ -1188,87 +1966,58 @@ with tabs[0]:
 with tabs[1]:
     st.subheader("Lists")
 
-    # --- helper: fetch og:image from a product page (best-effort, safe to fail) ---
-    def fetch_og_image(url: str) -> Optional[str]:
-        if not url or not (url.startswith("http://") or url.startswith("https://")):
-            return None
-        # Avoid doing heavy work on each rerun: simple in-memory memo
-        cache_key = f"_og_{url}"
-        if cache_key in st.session_state:
-            return st.session_state[cache_key]
-
-        try:
-            import requests
-            from bs4 import BeautifulSoup  # type: ignore
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                              "AppleWebKit/537.36 (KHTML, like Gecko) "
-                              "Chrome/124.0 Safari/537.36"
-            }
-            r = requests.get(url, headers=headers, timeout=5)
-            if r.status_code != 200 or "text/html" not in r.headers.get("Content-Type", ""):
-                st.session_state[cache_key] = None
-                return None
-            soup = BeautifulSoup(r.text, "html.parser")
-            # Try standard Open Graph first
-            og = soup.find("meta", attrs={"property": "og:image"}) or soup.find("meta", attrs={"name": "og:image"})
-            if og and og.get("content"):
-                img = og["content"].strip()
-                # Some sites give relative URLs
-                from urllib.parse import urljoin
-                img = urljoin(url, img)
-                st.session_state[cache_key] = img
-                return img
-            # Fallbacks used by some stores
-            tw = soup.find("meta", attrs={"name": "twitter:image"}) or soup.find("meta", attrs={"property": "twitter:image"})
-            if tw and tw.get("content"):
-                from urllib.parse import urljoin
-                img = urljoin(url, tw["content"].strip())
-                st.session_state[cache_key] = img
-                return img
-        except Exception:
-            pass
-        st.session_state[cache_key] = None
-        return None
-
     # Create list form
     with st.expander("Create a new list"):
         with st.form("create_list", clear_on_submit=True):
             new_title = st.text_input("List name", placeholder="e.g., Groceries or Alex's Birthday")
             list_type = st.selectbox("List type", ["normal", "wishlist"])
+            pasted = st.text_area("Items (optional, one per line)", placeholder="milk\neggs\nbread", height=100)
             if st.form_submit_button("Create") and (new_title or "").strip():
-                exec1(
-                    "INSERT INTO lists(title, family, type, created_by) VALUES(?,?,?,?)",
-                    (new_title.strip(), FAMILY, list_type, DISPLAY_NAME),
-                )
+                texts = [ln.strip() for ln in (pasted or "").splitlines() if ln.strip()]
+                with tx() as conn:   # list + pasted items in one commit
+                    new_list_id = conn.execute(
+                        "INSERT INTO lists(title, family, type, created_by) VALUES(?,?,?,?)",
+                        (new_title.strip(), FAMILY, list_type, DISPLAY_NAME),
+                    ).lastrowid
+                    if texts:
+                        conn.executemany(
+                            "INSERT INTO list_items(list_id, text, done) VALUES(?,?,0)",
+                            [(new_list_id, t) for t in texts],
+                        )
                 st.success("List created."); st.rerun()
 
     # Load lists for this family
-    lists = q(
-        """SELECT id, title, type, created_by 
-           FROM lists 
-           WHERE family=? AND (deleted_at IS NULL) 
-           ORDER BY id DESC LIMIT 100""",
-        (FAMILY,),
-    )
+    def _load_lists():
+        lists = [dict(r) for r in q(
+            """SELECT id, title, type, created_by 
+               FROM lists 
+               WHERE family=? AND (deleted_at IS NULL) 
+               ORDER BY id DESC LIMIT 100""",
+            (FAMILY,),
+        )]
+        # Items for every visible list in one query, bucketed per list (was one query per list)
+        list_ids = [lst["id"] for lst in lists]
+        items_by_list: Dict[int, list] = {lid: [] for lid in list_ids}
+        if list_ids:
+            # The 200-per-list cap is applied in SQL (ROW_NUMBER over idx_list_items_list_id),
+            # so a long list's older items never cross into Python
+            for it in q(
+                f"""SELECT id, list_id, text, url, image_url, done, claimed_by, purchased_by FROM (
+                        SELECT *, ROW_NUMBER() OVER (PARTITION BY list_id ORDER BY id DESC) AS rn
+                        FROM list_items WHERE list_id IN ({','.join('?' * len(list_ids))})
+                    ) WHERE rn <= 200
+                    ORDER BY list_id, id DESC""",
+                list_ids,
+            ):
+                items_by_list[it["list_id"]].append(dict(it))
+        return lists, items_by_list
+
+    # Idle reruns (other tabs' buttons, chat polling) reuse the last load
+    lists, items_by_list = fetch_if_changed(f"lists_{FAMILY}", db_version(), _load_lists)
 
     if not lists:
         st.info("No lists yet.")
     else:
-        # tiny always-works placeholder
-        inline_svg_data_uri = (
-            "data:image/svg+xml;utf8,"
-            "<svg xmlns='http://www.w3.org/2000/svg' width='150' height='150'>"
-            "<rect width='100%' height='100%' fill='%23eeeeee'/>"
-            "<text x='50%' y='50%' dominant-baseline='middle' text-anchor='middle' "
-            "fill='%23999999' font-family='Arial' font-size='14'>Preview</text>"
-            "</svg>"
-        )
-
-        def looks_like_image(url: str) -> bool:
-            u = (url or "").lower().split("?", 1)[0]
-            return any(u.endswith(ext) for ext in (".jpg",".jpeg",".png",".gif",".webp",".bmp"))
-
         for lst in lists:
             is_wishlist = (lst["type"] == "wishlist")
             you_are_creator = (DISPLAY_NAME == (lst["created_by"] or ""))
@@ -1297,12 +2046,22 @@ with tabs[1]:
                             # If no image_url provided but link exists, try to auto-fetch og:image
                             final_img = (img_url or "").strip() or None
                             link_clean = (link or "").strip() or None
-                            if not final_img and link_clean and not looks_like_image(link_clean):
-                                final_img = fetch_og_image(link_clean)  # may return None; that's fine
-                            exec1(
+                            want_og = not final_img and link_clean and not looks_like_image(link_clean)
+                            if want_og:
+                                # Same product already on one of this family's lists: reuse its image, no fetch
+                                known = q(
+                                    """SELECT li.image_url FROM list_items li JOIN lists l ON l.id = li.list_id
+                                       WHERE li.url=? AND li.image_url IS NOT NULL AND l.family=? LIMIT 1""",
+                                    (link_clean, FAMILY),
+                                )
+                                if known:
+                                    final_img, want_og = known[0]["image_url"], False
+                            new_item_id = exec1(
                                 "INSERT INTO list_items(list_id, text, url, image_url, done) VALUES(?,?,?,?,0)",
                                 (lst["id"], t.strip(), link_clean, final_img),
-                            )
+                            ).lastrowid
+                            if want_og:
+                                queue_og_image(new_item_id, link_clean)   # may find nothing; that's fine
                             st.rerun()
                     else:
                         c = st.columns([0.85, 0.15])
@@ -1317,13 +2076,8 @@ with tabs[1]:
                             )
                             st.rerun()
 
-                # ---------------- Fetch items ----------------
-                items = q(
-                    """SELECT id, text, url, image_url, done, claimed_by, purchased_by
-                       FROM list_items WHERE list_id=? 
-                       ORDER BY id DESC LIMIT 200""",
-                    (lst["id"],),
-                )
+                # ---------------- Items (prefetched above) ----------------
+                items = items_by_list[lst["id"]]
 
                 # ---------------- Render items ----------------
                 for it in items:
@@ -1332,7 +2086,7 @@ with tabs[1]:
                         left, right = st.columns([0.75, 0.25])
                         with left:
                             # choose best image source
-                            img_src = it["image_url"] or (it["url"] if looks_like_image(it["url"] or "") else inline_svg_data_uri)
+                            img_src = it["image_url"] or (it["url"] if looks_like_image(it["url"] or "") else WISHLIST_PLACEHOLDER_IMG)
 
                             # clickable image + title
                             if it["url"]:
@@ -1449,7 +2203,10 @@ with tabs[2]:
             # FIX: include content='' to satisfy old DBs with NOT NULL & no default
             exec1("INSERT INTO documents(title, content, family) VALUES(?,?,?)", (title.strip(), "", FAMILY)); st.success("Document created."); st.rerun()
 
-    docs = q("""SELECT * FROM documents WHERE family=? AND (deleted_at IS NULL) ORDER BY id DESC LIMIT 50""", (FAMILY,))
+    docs = fetch_if_changed(
+        f"docs_{FAMILY}", db_version(),
+        lambda: [dict(r) for r in q("""SELECT * FROM documents WHERE family=? AND (deleted_at IS NULL) ORDER BY id DESC LIMIT 50""", (FAMILY,))],
+    )
     if not docs:
         st.info("No documents.")
     else:
@@ -1472,38 +2229,12 @@ with tabs[3]:
     def to_exclusive_end(d: date) -> datetime:
         return datetime.combine(d + timedelta(days=1), time(0, 0))
 
-    def from_iso(dt_s: Optional[str]) -> Optional[datetime]:
-        if not dt_s: return None
-        try: return datetime.fromisoformat(dt_s)
-        except Exception: return None
-
     def load_events_between(d0: date, d1: date, who: str = "") -> List[Dict]:
-        rows = q("SELECT * FROM events WHERE family=? ORDER BY start_at ASC", (FAMILY,))
-        out: List[Dict] = []
-        for e in rows:
-            sdt = from_iso(e["start_at"])
-            if not sdt: continue
-            sd = sdt.date()
-            if d0 <= sd <= d1:
-                if who and who.lower() not in (e["assignees"] or "").lower():
-                    continue
-                s = (e["assignees"] or "default")
-                h = 0
-                for ch in s: h = (h * 33 + ord(ch)) & 0xFFFFFFFF
-                palette = ["#4285F4","#DB4437","#F4B400","#0F9D58","#AB47BC","#00ACC1","#EF6C00","#5C6BC0","#26A69A","#EC407A"]
-                color = palette[h % len(palette)]
-                all_day = bool(e["all_day"])
-                out.append({
-                    "id": str(e["id"]),
-                    "title": e["title"],
-                    "start": e["start_at"],
-                    "end":   e["end_at"],
-                    "allDay": all_day,
-                    "backgroundColor": color + "80",
-                    "borderColor": color,
-                    "extendedProps": {"assignees": e["assignees"] or ""},
-                })
-        return out
+        # Cached per visible range; the assignee filter runs on the cached rows
+        events = get_calendar_events(FAMILY, d0, d1, db_version())
+        if who:
+            events = [e for e in events if who.lower() in e["extendedProps"]["assignees"].lower()]
+        return events
 
     today = date.today()
     view = st.session_state.get("fc_view", "dayGridMonth")
@@ -1567,7 +2298,7 @@ with tabs[3]:
                     e_iso = datetime.combine(ed, etime).isoformat()
                 exec1("""INSERT INTO events(title, start_at, end_at, assignees, family, all_day)
                          VALUES(?,?,?,?,?,?)""",
-                      (title.strip(), s_iso, e_iso, assignees.strip(), FAMILY, 1 if all_day else 0))
+                      (title.strip(), s_iso, e_iso, normalize_assignees(assignees), FAMILY, 1 if all_day else 0))
                 st.success("Event created."); st.rerun()
 
     # Determine window and load events
@@ -1603,8 +2334,11 @@ with tabs[3]:
     }
 
     if CAL_OK:
-        # Force FullCalendar to remount when view/date change
-        cal_key = f"fullcalendar_{view}_{ref.isoformat()}"
+        # Force FullCalendar to remount when view/date or the events change; an identical
+        # payload keeps the same key, so benign reruns don't re-initialise it
+        events_hash = hashlib.blake2b(json.dumps(events, sort_keys=True, default=str).encode(),
+                                      digest_size=8).hexdigest()
+        cal_key = f"fullcalendar_{view}_{ref.isoformat()}_{events_hash}"
         fc_calendar(events=events, options=options, key=cal_key)
     else:
         st.warning(
@@ -1614,13 +2348,43 @@ with tabs[3]:
 
     # Manage events (edit/delete)
     st.markdown("### Manage events")
-    evs_db = q("SELECT * FROM events WHERE family=? ORDER BY start_at ASC", (FAMILY,))
+    cal_version = db_version()
+    evs_db = get_family_events(FAMILY, cal_version)
+    # Event bodies (editor, RSVP buttons, attendee chips) only render once opened, so
+    # RSVPs and profiles are fetched for the open events alone: none while all are shut
+    open_ids = [e["id"] for e in evs_db if st.session_state.get(f"exp_{e['id']}")]
+    rsvps_by_event: Dict[int, list] = {eid: [] for eid in open_ids}
+    profiles: Dict[str, Tuple[str, str, str]] = {}
+    if open_ids:
+        for eid, uname, status in q_tuples(f"""
+                SELECT event_id, username, status FROM event_rsvps
+                WHERE event_id IN ({','.join('?' * len(open_ids))})
+                ORDER BY event_id,
+                  CASE status WHEN 'going' THEN 0 WHEN 'maybe' THEN 1 ELSE 2 END,
+                  username COLLATE NOCASE
+            """, open_ids):
+            rsvps_by_event[eid].append({"username": uname, "status": status})
+        # Each attendee's profile once, however many events they answered
+        unames = sorted({r["username"] for rows in rsvps_by_event.values() for r in rows})
+        if unames:
+            profiles = {u: (f, l, a) for u, f, l, a in q_tuples(
+                f"""SELECT username, COALESCE(first_name,''), COALESCE(last_name,''), COALESCE(avatar_path,'')
+                    FROM user_profiles WHERE family=? AND username IN ({','.join('?' * len(unames))})""",
+                [FAMILY, *unames])}
     for e in evs_db:
-        sdt = from_iso(e["start_at"]) or datetime.now()
-        edt = from_iso(e["end_at"])
+        sdt = e["start_dt"] or datetime.now()
+        edt = e["end_dt"]
         all_day_val = bool(e["all_day"])
-        disp_end_date = (edt - timedelta(days=1)).date() if (all_day_val and edt) else ((edt.date() if edt else sdt.date()))
-        with st.expander(f"✏️ {e['title']} · {sdt.strftime('%Y-%m-%d %H:%M')}"):
+        disp_end_date = e["end_date"] or sdt.date()
+        # A collapsed st.expander still runs its whole body; a toggle button skips it
+        open_key = f"exp_{e['id']}"
+        is_open = e["id"] in rsvps_by_event
+        header = f"✏️ {e['title']} · {e['start_label'] or sdt.strftime('%Y-%m-%d %H:%M')}"
+        if st.button(("▾ " if is_open else "▸ ") + header, key=f"tog_{e['id']}"):
+            st.session_state[open_key] = not is_open; st.rerun()
+        if not is_open:
+            continue
+        with st.container(border=True):
             title = st.text_input("Title", value=e["title"], key=f"title_{e['id']}")
             cc = st.columns([1,1,1,1,1])
             with cc[0]: sd = st.date_input("Start Date", value=sdt.date(), key=f"sd_{e['id']}")
@@ -1649,7 +2413,7 @@ with tabs[3]:
                         exec1("""UPDATE events
                                  SET title=?, start_at=?, end_at=?, assignees=?, all_day=?
                                  WHERE id=? AND family=?""",
-                              (title.strip() or "Untitled", s_iso, e_iso, assignees.strip(),
+                              (title.strip() or "Untitled", s_iso, e_iso, normalize_assignees(assignees),
                                1 if all_day else 0, e["id"], FAMILY))
                         st.success("Updated."); st.rerun()
             with b[1]:
@@ -1661,38 +2425,17 @@ with tabs[3]:
             st.markdown("#### 🗳️ RSVP")
 
             # Current user's RSVP state
-            _r = q("SELECT status FROM event_rsvps WHERE event_id=? AND username=? LIMIT 1", (e["id"], DISPLAY_NAME))
-            _mine = (_r[0]["status"] if _r else None)
+            _rows = rsvps_by_event[e["id"]]
+            _mine = next((r["status"] for r in _rows if r["username"] == DISPLAY_NAME), None)
 
             # Buttons row
             rb1, rb2, rb3, rb4 = st.columns([0.18, 0.18, 0.18, 0.46])
-            with rb1:
-                lab = "✅ Going" + (" (you)" if _mine == "going" else "")
-                if st.button(lab, key=f"rsvp_go_{e['id']}"):
-                    exec1("""INSERT INTO event_rsvps(event_id, username, status) 
-                             VALUES(?,?,?) 
-                             ON CONFLICT(event_id, username) 
-                             DO UPDATE SET status=excluded.status, responded_at=datetime('now')""",
-                          (e["id"], DISPLAY_NAME, "going"))
-                    st.rerun()
-            with rb2:
-                lab = "🤔 Maybe" + (" (you)" if _mine == "maybe" else "")
-                if st.button(lab, key=f"rsvp_maybe_{e['id']}"):
-                    exec1("""INSERT INTO event_rsvps(event_id, username, status) 
-                             VALUES(?,?,?) 
-                             ON CONFLICT(event_id, username) 
-                             DO UPDATE SET status=excluded.status, responded_at=datetime('now')""",
-                          (e["id"], DISPLAY_NAME, "maybe"))
-                    st.rerun()
-            with rb3:
-                lab = "❌ Can't" + (" (you)" if _mine == "cant" else "")
-                if st.button(lab, key=f"rsvp_cant_{e['id']}"):
-                    exec1("""INSERT INTO event_rsvps(event_id, username, status) 
-                             VALUES(?,?,?) 
-                             ON CONFLICT(event_id, username) 
-                             DO UPDATE SET status=excluded.status, responded_at=datetime('now')""",
-                          (e["id"], DISPLAY_NAME, "cant"))
-                    st.rerun()
+            for col, (status, label, key) in zip((rb1, rb2, rb3), RSVP_CHOICES):
+                with col:
+                    lab = label + (" (you)" if _mine == status else "")
+                    if st.button(lab, key=f"rsvp_{key}_{e['id']}"):
+                        exec1(RSVP_UPSERT_SQL, (e["id"], DISPLAY_NAME, status))
+                        st.rerun()
             with rb4:
                 if _mine is not None:
                     if st.button("Clear my RSVP", key=f"rsvp_clear_{e['id']}"):
@@ -1703,58 +2446,14 @@ with tabs[3]:
 
             # Attendees (with profile pics)
             st.markdown("#### 👥 Attendees")
-            _rows = q("""
-                SELECT r.username, r.status,
-                       COALESCE(p.first_name,'') AS first_name,
-                       COALESCE(p.last_name,'')  AS last_name,
-                       COALESCE(p.avatar_path,'') AS avatar_path
-                FROM event_rsvps r
-                LEFT JOIN user_profiles p 
-                  ON p.family=? AND p.username=r.username
-                WHERE r.event_id=?
-                ORDER BY 
-                  CASE r.status WHEN 'going' THEN 0 WHEN 'maybe' THEN 1 ELSE 2 END,
-                  r.username COLLATE NOCASE
-            """, (FAMILY, e["id"]))
-
             if not _rows:
                 st.caption("No RSVPs yet.")
             else:
-                # Inline chips with color by status (no external CSS dependency)
-                def _chip_border(status: str) -> str:
-                    if status == "going": return "#1b5e20"   # green-ish
-                    if status == "maybe": return "#9e7500"   # amber-ish
-                    return "#7b1c1c"                         # red-ish
-
                 html_parts = []
                 for r in _rows:
-                    full = (r["first_name"] + " " + r["last_name"]).strip() or r["username"]
-                    full = esc(full)
-                    bcol = _chip_border(r["status"])
-                    avat = r["avatar_path"] or ""
-
-                    # Build avatar (always 32×32) inside an inline-block wrapper to avoid layout breaks
-                    if avat and os.path.exists(avat):
-                        avatar_inner = f"<img src='{esc(avat)}' style='width:100%;height:100%;object-fit:cover;'/>"
-                    else:
-                        initials = "".join([part[0].upper() for part in full.split()[:2] if part]) or "?"
-                        avatar_inner = (
-                            f"<span style='width:100%;height:100%;display:flex;align-items:center;justify-content:center;"
-                            f"background:#888;color:#fff;font-size:14px;font-weight:600'>{initials}</span>"
-                        )
-                    avatar = (
-                        f"<span style='display:inline-block;width:32px;height:32px;border-radius:50%;overflow:hidden'>"
-                        f"{avatar_inner}</span>"
-                    )
-
-                    # One self-contained chip with inline styles
-                    status_label = {"going":"Going","maybe":"Maybe","cant":"Can't"}.get(r["status"], r["status"])
-                    chip = (
-                        f"<span style='display:inline-flex;align-items:center;gap:8px;padding:6px 10px;"
-                        f"border-radius:999px;border:1px solid {bcol};margin:2px;font-size:13px;line-height:1;'>"
-                        f"{avatar}<span>{full}</span><span style='opacity:0.7'>· {status_label}</span></span>"
-                    )
-                    html_parts.append(chip)
+                    first, last, avat = profiles.get(r["username"], ("", "", ""))
+                    full = (first + " " + last).strip() or r["username"]
+                    html_parts.append(attendee_chip_html(full, r["status"], avat if upload_exists(avat, cal_version) else ""))
 
                 st.markdown(" ".join(html_parts), unsafe_allow_html=True)
             # === END ADD-ON BLOCK D ===
@@ -1769,42 +2468,58 @@ with tabs[4]:
             if st.form_submit_button("Create") and (name or "").strip():
                 exec1("INSERT INTO albums(name, family) VALUES(?,?)", (name.strip(), FAMILY)); st.success("Album created."); st.rerun()
 
-    albums = q("SELECT * FROM albums WHERE family=? ORDER BY id DESC LIMIT 100", (FAMILY,))
+    albums = get_albums(FAMILY, db_version())
     alb_opts = {a["name"]: a["id"] for a in albums} if albums else {}
 
     with st.form("create_post", clear_on_submit=True):
         st.markdown("#### New post")
         album_id = st.selectbox("Album (optional)", ["(none)"] + list(alb_opts.keys()))
         caption = st.text_input("Caption")
-        uploads = st.file_uploader("Photos / Videos", type=["png","jpg","jpeg","gif","mp4","webm","mov"], accept_multiple_files=True)
+        uploads = st.file_uploader("Photos / Videos", type=["png","jpg","jpeg","gif","webp","mp4","webm","mov"], accept_multiple_files=True)
         if st.form_submit_button("Post"):
-            exec1("INSERT INTO posts(family, album_id, author, caption) VALUES(?,?,?,?)",
-                  (FAMILY, alb_opts.get(album_id) if album_id != "(none)" else None, DISPLAY_NAME, caption or ""))
-            post_id = q("SELECT id FROM posts WHERE family=? ORDER BY id DESC LIMIT 1", (FAMILY,))[0]["id"]
-            if uploads:
-                for up in uploads:
-                    path, thumb, mime, media_type = save_media(up)
-                    exec1("INSERT INTO post_media(post_id, path, thumb_path, mime, media_type) VALUES(?,?,?,?,?)",
-                          (post_id, path, thumb, mime, media_type))
+            # Files first (save_media may st.stop on an oversized upload), then the
+            # post and all its media rows as one transaction / one commit
+            saved = [save_media(up) for up in uploads or []]
+            with tx() as conn:
+                post_id = exec1("INSERT INTO posts(family, album_id, author, caption) VALUES(?,?,?,?)",
+                                (FAMILY, alb_opts.get(album_id) if album_id != "(none)" else None, DISPLAY_NAME, caption or "")).lastrowid
+                conn.executemany("INSERT INTO post_media(post_id, path, thumb_path, mime, media_type) VALUES(?,?,?,?,?)",
+                                 [(post_id, path, queue_thumb(path, mime, media_type), mime, media_type)
+                                  for path, mime, media_type in saved])
             st.success("Posted."); st.rerun()
 
     page = st.session_state.get("feed_page", 0)
-    posts = q("""SELECT p.*,
-                        (SELECT COUNT(*) FROM post_likes pl WHERE pl.post_id=p.id) AS like_count,
-                        (SELECT COUNT(*) FROM post_comments pc WHERE pc.post_id=p.id) AS comment_count
-                 FROM posts p 
-                 WHERE p.family=? 
-                 ORDER BY p.id DESC
-                 LIMIT ? OFFSET ?""", (FAMILY, PAGE_SIZE, page*PAGE_SIZE))
+    feed_version = db_version()
+    posts = get_feed_page(FAMILY, page, feed_version)
 
+    total_posts = get_counter(f"posts:{FAMILY}")
     c1,c2,c3 = st.columns(3)
     with c1:
         if st.button("◀ Prev", disabled=page==0, key="feed_prev"):
             st.session_state["feed_page"] = max(0, page-1); st.rerun()
+    with c2:
+        st.caption(f"Page {page+1} of {max(1, -(-total_posts // PAGE_SIZE))} · {total_posts} posts")
     with c3:
-        if st.button("Next ▶", disabled=len(posts)<PAGE_SIZE, key="feed_next"):
+        if st.button("Next ▶", disabled=(page+1)*PAGE_SIZE >= total_posts, key="feed_next"):
             st.session_state["feed_page"] = page+1; st.rerun()
 
+    # Media, my likes and comments for the whole page: three IN (...) queries
+    # instead of three per post
+    post_ids = [p["id"] for p in posts]
+    media_by_post: Dict[int, list] = {pid: [] for pid in post_ids}
+    comments_by_post: Dict[int, list] = {pid: [] for pid in post_ids}
+    liked_ids: set = set()
+    if post_ids:
+        ph = ",".join("?" * len(post_ids))
+        for m in q(f"SELECT * FROM post_media WHERE post_id IN ({ph}) ORDER BY post_id, id ASC", post_ids):
+            if len(media_by_post[m["post_id"]]) < 12:
+                media_by_post[m["post_id"]].append(m)
+        for c in q(f"SELECT * FROM post_comments WHERE post_id IN ({ph}) ORDER BY post_id, id DESC", post_ids):
+            if len(comments_by_post[c["post_id"]]) < 100:
+                comments_by_post[c["post_id"]].append(c)
+        liked_ids = {r[0] for r in q_tuples(
+            f"SELECT post_id FROM post_likes WHERE author=? AND post_id IN ({ph})", [DISPLAY_NAME, *post_ids])}
+
     if not posts:
         st.info("No posts yet.")
     else:
@@ -1815,7 +2530,7 @@ with tabs[4]:
                     st.markdown(f"**{esc(p['author'])}** · {esc(p['created_at'])}")
                     if p["caption"]: st.write(esc(p["caption"]))
                 with head[1]:
-                    liked = bool(q("SELECT 1 FROM post_likes WHERE post_id=? AND author=? LIMIT 1", (p["id"], DISPLAY_NAME)))
+                    liked = p["id"] in liked_ids
                     if st.button(("❤️ Unlike" if liked else "🤍 Like") + f" ({p['like_count']})", key=f"like_{p['id']}"):
                         if liked:
                             exec1("DELETE FROM post_likes WHERE post_id=? AND author=?", (p["id"], DISPLAY_NAME))
@@ -1823,21 +2538,25 @@ with tabs[4]:
                             exec1("INSERT OR IGNORE INTO post_likes(post_id, author) VALUES(?,?)", (p["id"], DISPLAY_NAME))
                         st.rerun()
 
-                media = q("SELECT * FROM post_media WHERE post_id=? ORDER BY id ASC LIMIT 12", (p["id"],))
+                media = media_by_post[p["id"]]
                 if media:
                     cols = st.columns(3)
                     for idx, m in enumerate(media):
                         with cols[idx % 3]:
+                            # Thumbs land on the pool after the commit, so a thumb missing from the
+                            # per-version listing gets one stat() until the next write re-lists
+                            thumb = m["thumb_path"]
+                            thumb_ok = bool(thumb) and (upload_exists(thumb, feed_version) or os.path.exists(thumb))
                             if m["media_type"] == "video":
-                                if os.path.exists(m["path"]):
+                                if upload_exists(m["path"], feed_version):
                                     st.video(m["path"])
                                 else:
                                     st.warning("Video missing.")
-                                if m["thumb_path"] and os.path.exists(m["thumb_path"]):
-                                    st.image(m["thumb_path"], use_container_width=True, caption="Preview")
+                                if thumb_ok:
+                                    st.image(thumb, use_container_width=True, caption="Preview")
                             else:
-                                img_path = m["thumb_path"] or m["path"]
-                                if os.path.exists(img_path):
+                                img_path = thumb if thumb_ok else m["path"]
+                                if thumb_ok or upload_exists(img_path, feed_version):
                                     st.image(img_path, use_container_width=True)
                                 else:
                                     st.warning("Image missing.")
@@ -1848,10 +2567,12 @@ with tabs[4]:
                         if st.form_submit_button("Comment") and (txt or "").strip():
                             exec1("INSERT INTO post_comments(post_id, author, text) VALUES(?,?,?)",
                                   (p["id"], DISPLAY_NAME, txt.strip())); st.rerun()
-                    comments = q("SELECT * FROM post_comments WHERE post_id=? ORDER BY id DESC LIMIT 100", (p["id"],))
+                    comments = comments_by_post[p["id"]]
                     if not comments:
                         st.caption("No comments yet.")
-                    else:
+                    elif not st.checkbox("Manage comments", key=f"manage_post_comments_{p['id']}"):
+                        st.markdown(comments_html(comments), unsafe_allow_html=True)
+                    else:   # per-comment rows only when someone wants the delete buttons
                         for c in comments:
                             row = st.columns([6,1])
                             with row[0]:
@@ -1878,12 +2599,9 @@ with tabs[5]:
     with c2:
         notify = st.checkbox("Notifications (browser + beep)", value=True, key="chat_notify_enable")
 
-    if live:
-        st_autorefresh(interval=interval*1000, key=f"chat_live_autorefresh")
-
     # Rooms scoped to FAMILY
-    existing_rooms = [r["room"] for r in q(
-        "SELECT DISTINCT room FROM chat_messages WHERE family=? ORDER BY room COLLATE NOCASE", (FAMILY,)
+    existing_rooms = [r[0] for r in q_tuples(
+        "SELECT name FROM chat_rooms WHERE family=? ORDER BY name COLLATE NOCASE", (FAMILY,)
     )]
     default_room = "general"
     if default_room not in existing_rooms:
@@ -1896,164 +2614,124 @@ with tabs[5]:
         with st.form("create_room", clear_on_submit=True):
             new_room = st.text_input("Create room", placeholder="e.g., planning, chores")
             if st.form_submit_button("Add Room") and (new_room or "").strip():
-                exec1("INSERT INTO chat_messages(family, room, author, text) VALUES(?,?,?,?)",
-                      (FAMILY, new_room.strip(), "system", f"Room '{new_room.strip()}' created"))
+                exec1("INSERT OR IGNORE INTO chat_rooms(family, name) VALUES(?,?)", (FAMILY, new_room.strip()))
                 st.success("Room created."); st.rerun()
 
     st.markdown("---")
 
     # ---- Fetch last N messages ----
     LAST_N = 100
-    rows_desc = q("""SELECT * FROM chat_messages 
-                     WHERE family=? AND room=?
-                     ORDER BY id DESC
-                     LIMIT ?""", (FAMILY, room, LAST_N))
-    msgs = list(reversed(rows_desc))
-
-    state_key = f"last_seen_chat_{FAMILY}_{room}"
-    prev_seen = int(st.session_state.get(state_key, 0) or 0)
-    last_id = int(msgs[-1]["id"]) if msgs else 0
-    new_from_others = [m for m in msgs if m["id"] > prev_seen and m["author"] != DISPLAY_NAME]
-    new_count = len(new_from_others)
-
-    st.markdown("""
-<style>
-.chat-box {
-    max-height: 520px;
-    overflow-y: auto;
-    padding: 8px 10px;
-    border: 1px solid #ddd;
-    border-radius: 10px;
-    background: #fafafa;
-}
-[data-theme="dark"] .chat-box {
-    background: #121212;
-    border-color: #2e2e2e;
-}
-
-.msg {
-    margin: 6px 0;
-    display: flex;
-    flex-direction: column;
-}
-.msg .meta {
-    font-size: 11px;
-    color: #666;
-    margin: 0 6px 2px 6px;
-}
-[data-theme="dark"] .msg .meta {
-    color: #c8c8c8;
-}
-
-.bubble {
-    display: inline-block;
-    padding: 8px 12px;
-    border-radius: 14px;
-    background: #ffffff;
-    border: 1px solid #e6e6e6;
-    color: #000000;
-    max-width: 85%;
-    word-wrap: break-word;
-    white-space: pre-wrap;
-}
-[data-theme="dark"] .bubble {
-    background: #1d1f22;
-    border-color: #2f3236;
-    color: #f0f0f0;
-}
-[data-theme="dark"] .bubble a {
-    color: #a7c7ff;
-}
-
-.me {
-    align-items: flex-end;
-}
-.me .bubble {
-    background: #e8f0ff;
-    border-color: #d0dcff;
-}
-[data-theme="dark"] .me .bubble {
-    background: #18314f;
-    border-color: #2b4a6f;
-}
-</style>
-""", unsafe_allow_html=True)
-
-    # Optional room badge
-    if new_count > 0:
-        st.caption(f"🔔 {new_count} new message(s) since you last viewed this room")
-
-    # ---- Render messages in a scrollable window ----
-    st.markdown(f'<div class="chat-box" id="chatbox">', unsafe_allow_html=True)
-    if not msgs:
-        st.markdown('<div class="msg"><div class="bubble">No messages yet. Say hi 👋</div></div>', unsafe_allow_html=True)
-    else:
-        for m in msgs:
-            own = (m["author"] == DISPLAY_NAME)
-            cls = "msg me" if own else "msg"
-            author = esc(m["author"])
-            ts = esc(m["created_at"])
-            text = esc(m["text"])
-            st.markdown(
-                f'<div class="{cls}">'
-                f'  <div class="meta">{author} · {ts}</div>'
-                f'  <div class="bubble">{text}</div>'
-                f'</div>',
-                unsafe_allow_html=True
+    cursor_key = f"chat_cursor_{FAMILY}_{room}"   # None = live tail; else browsing ids < cursor
+
+    # Live updates re-run only this window (and its poll) on the timer, not every
+    # tab's queries; paging / send / delete still trigger a full rerun
+    @st.fragment(run_every=interval if live else None)
+    def _chat_window():
+        chat_cursor = st.session_state.get(cursor_key)
+        if chat_cursor is None:
+            msgs = chat_tail(FAMILY, room, LAST_N)
+        else:
+            msgs = get_chat_page(FAMILY, room, chat_cursor, LAST_N, chat_token(FAMILY, room))
+
+        state_key = f"last_seen_chat_{FAMILY}_{room}"
+        prev_seen = int(st.session_state.get(state_key, 0) or 0)
+        last_id = int(msgs[-1][CHAT_ID]) if msgs else 0
+        # Nothing past last-seen in the held tail means nothing new: no query on idle ticks.
+        # Otherwise count in SQL, on the (family, room, id) range past prev_seen
+        new_count, latest_id = 0, None
+        if chat_cursor is None and last_id > prev_seen:
+            new_count, latest_id = q_tuples(
+                """SELECT COUNT(*), MAX(id) FROM chat_messages
+                   WHERE family=? AND room=? AND id > ? AND author <> ?""",
+                (FAMILY, room, prev_seen, DISPLAY_NAME))[0]
+
+        # Optional room badge
+        if new_count > 0:
+            st.caption(f"🔔 {new_count} new message(s) since you last viewed this room")
+
+        # History paging (keyset on id)
+        hc1, hc2 = st.columns([0.5, 0.5])
+        with hc1:
+            if len(msgs) == LAST_N and st.button("⬆ Older messages", key="chat_older"):
+                st.session_state[cursor_key] = int(msgs[0][CHAT_ID]); st.rerun()
+        with hc2:
+            if chat_cursor is not None and st.button("⬇ Back to latest", key="chat_latest"):
+                st.session_state[cursor_key] = None; st.rerun()
+
+        # ---- Render messages in a scrollable window ----
+        # One markdown element for the whole window: one delta per rerun instead of one
+        # per message, and the bubbles actually end up inside .chat-box. Newlines go in as
+        # &#10; (pre-wrap still breaks on them) so a blank line can't end the HTML block early.
+        # Timestamps are SQLite's own datetime('now'): no escaping needed
+        if not msgs:
+            body = '<div class="msg"><div class="bubble">No messages yet. Say hi 👋</div></div>'
+        else:
+            body = "".join(
+                f'<div class="{"msg me" if m_author == DISPLAY_NAME else "msg"}">'
+                f'<div class="meta">{esc(m_author)} · {m_ts}</div>'
+                f'<div class="bubble">{_esc(m_text, quote=False).replace(chr(10), "&#10;")}</div>'
+                f'</div>'
+                for _mid, m_author, m_text, m_ts in msgs
             )
-    st.markdown("</div>", unsafe_allow_html=True)
-
-    # ---- Auto-scroll to bottom on render ----
-    st.markdown(
-        """
-        <script>
-        const box = window.parent.document.getElementById('chatbox') || document.getElementById('chatbox');
-        if (box) { box.scrollTop = box.scrollHeight; }
-        </script>
-        """,
-        unsafe_allow_html=True
-    )
+        st.markdown(f'<div class="chat-box" id="chatbox">{body}</div>', unsafe_allow_html=True)
 
-    # ---- Browser notification + subtle beep for new messages from others ----
-    if notify and new_count > 0:
-        import json
-        latest = new_from_others[-1] if new_from_others else msgs[-1]
-        latest_author = latest["author"] if latest else ""
-        latest_text = latest["text"] if latest else ""
+        # ---- Auto-scroll to bottom on render ----
         st.markdown(
-            f"""
+            """
             <script>
-            (function() {{
-              const body = {json.dumps(str(latest_author) + ": " + str(latest_text))}.slice(0, 160);
-              if (typeof Notification !== 'undefined') {{
-                if (Notification.permission === 'default') {{
-                  Notification.requestPermission();
-                }}
-                if (Notification.permission === 'granted') {{
-                  const n = new Notification('Hive: new message', {{ body: body }});
-                  setTimeout(() => n.close(), 5000);
-                }}
-              }}
-              try {{
-                const Ctx = window.AudioContext || window.webkitAudioContext;
-                const ctx = new Ctx();
-                const o = ctx.createOscillator();
-                const g = ctx.createGain();
-                o.type = 'sine';
-                o.frequency.value = 880;
-                o.connect(g); g.connect(ctx.destination);
-                g.gain.setValueAtTime(0.0001, ctx.currentTime);
-                g.gain.exponentialRampToValueAtTime(0.2, ctx.currentTime + 0.01);
-                o.start();
-                g.gain.exponentialRampToValueAtTime(0.0001, ctx.currentTime + 0.3);
-                o.stop(ctx.currentTime + 0.35);
-              }} catch (e) {{}}
-            }})();
+            const box = window.parent.document.getElementById('chatbox') || document.getElementById('chatbox');
+            if (box) { box.scrollTop = box.scrollHeight; }
             </script>
             """,
             unsafe_allow_html=True
         )
 
+        # ---- Browser notification + subtle beep for new messages from others ----
+        # Fires once per newest message: later ticks (or reruns) with the same tail stay quiet
+        notified_key = f"chat_notified_{FAMILY}_{room}"
+        if notify and new_count > 0 and latest_id != st.session_state.get(notified_key):
+            st.session_state[notified_key] = latest_id
+            latest_author, latest_text = next(iter(q_tuples(
+                "SELECT author, text FROM chat_messages WHERE id=?", (latest_id,))), ("", ""))
+            st.markdown(
+                f"""
+                <script>
+                (function() {{
+                  const body = {json.dumps(str(latest_author) + ": " + str(latest_text))}.slice(0, 160);
+                  if (typeof Notification !== 'undefined') {{
+                    if (Notification.permission === 'default') {{
+                      Notification.requestPermission();
+                    }}
+                    if (Notification.permission === 'granted') {{
+                      const n = new Notification('Hive: new message', {{ body: body }});
+                      setTimeout(() => n.close(), 5000);
+                    }}
+                  }}
+                  try {{
+                    const Ctx = window.AudioContext || window.webkitAudioContext;
+                    const ctx = new Ctx();
+                    const o = ctx.createOscillator();
+                    const g = ctx.createGain();
+                    o.type = 'sine';
+                    o.frequency.value = 880;
+                    o.connect(g); g.connect(ctx.destination);
+                    g.gain.setValueAtTime(0.0001, ctx.currentTime);
+                    g.gain.exponentialRampToValueAtTime(0.2, ctx.currentTime + 0.01);
+                    o.start();
+                    g.gain.exponentialRampToValueAtTime(0.0001, ctx.currentTime + 0.3);
+                    o.stop(ctx.currentTime + 0.35);
+                  }} catch (e) {{}}
+                }})();
+                </script>
+                """,
+                unsafe_allow_html=True
+            )
+
+        # ---- Finalize "last seen" state (never rewind it while browsing history) ----
+        st.session_state[state_key] = max(prev_seen, last_id)
+
+    _chat_window()
+
     # ---- Quick delete of your recent messages ----
     mine = q("""SELECT id, text, created_at FROM chat_messages 
                 WHERE family=? AND room=? AND author=?
@@ -2087,11 +2765,9 @@ with tabs[5]:
         if send and (msg or "").strip():
             exec1("INSERT INTO chat_messages(family, room, author, text) VALUES(?,?,?,?)",
                   (FAMILY, room, DISPLAY_NAME, msg.strip()))
+            st.session_state[cursor_key] = None   # jump back to the live tail
             st.rerun()
 
-    # ---- Finalize "last seen" state ----
-    st.session_state[state_key] = last_id
-
 # =============================================================================
 # End of file
 # =============================================================================
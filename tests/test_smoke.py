@@ -0,0 +1,83 @@
+"""Smoke test for the live DB path: init_schema() and tx() on a throwaway HIVE_DB_PATH.
+
+streamlit_app.py is executed outside `streamlit run` ("bare" mode: st.* calls render
+nothing), which is enough to reach its connection helpers. Run with
+`python -m unittest discover tests` (or pytest).
+"""
+import logging
+import os
+import runpy
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+APP = Path(__file__).resolve().parent.parent / "streamlit_app.py"
+
+
+class SmokeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls._env = {k: os.environ.get(k) for k in ("HIVE_DB_PATH", "HIVE_UPLOAD_DIR")}
+        cls.db_path = os.path.join(cls._tmp.name, "hive.db")
+        os.environ["HIVE_DB_PATH"] = cls.db_path
+        os.environ["HIVE_UPLOAD_DIR"] = os.path.join(cls._tmp.name, "uploads")
+        logging.disable(logging.WARNING)   # bare mode warns about the missing ScriptRunContext
+        try:
+            cls.app = runpy.run_path(str(APP), run_name="__smoke__")
+        finally:
+            logging.disable(logging.NOTSET)
+
+    @classmethod
+    def tearDownClass(cls):
+        for k, v in cls._env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        cls._tmp.cleanup()
+
+    def _titles(self):
+        # a separate connection: only committed rows are visible
+        with sqlite3.connect(self.db_path) as c:
+            return {r[0] for r in c.execute("SELECT title FROM lists")}
+
+    def test_init_schema(self):
+        self.assertTrue(self.app["init_schema"]())
+        with sqlite3.connect(self.db_path) as c:
+            names = {r[0] for r in c.execute("SELECT name FROM sqlite_master")}
+            mode = c.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertLessEqual({"notes", "lists", "list_items", "counters", "idx_list_items_url"}, names)
+        self.assertEqual(mode, "wal")
+
+    def test_tx_commits(self):
+        with self.app["tx"]() as conn:
+            conn.execute("INSERT INTO lists(title, family) VALUES('committed', 'smoke')")
+            with self.app["tx"]():   # nested: joins the outer transaction
+                conn.execute("INSERT INTO lists(title, family) VALUES('nested', 'smoke')")
+        self.assertLessEqual({"committed", "nested"}, self._titles())
+        self.assertFalse(self.app["get_conn"]().in_transaction)
+
+    def test_tx_rolls_back_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.app["tx"]() as conn:
+                conn.execute("INSERT INTO lists(title, family) VALUES('rolled back', 'smoke')")
+                raise ValueError
+        self.assertNotIn("rolled back", self._titles())
+        self.assertFalse(self.app["get_conn"]().in_transaction)
+
+    def test_tx_commits_before_stop(self):
+        control = self.app["SCRIPT_CONTROL_EXC"]
+        if not control:
+            self.skipTest("Streamlit's StopException is not importable")
+        with self.assertRaises(control):
+            with self.app["tx"]() as conn:
+                conn.execute("INSERT INTO lists(title, family) VALUES('before stop', 'smoke')")
+                raise self.app["StopException"]()
+        self.assertIn("before stop", self._titles())
+        self.assertFalse(self.app["get_conn"]().in_transaction)
+
+
+if __name__ == "__main__":
+    unittest.main()